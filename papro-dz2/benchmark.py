@@ -0,0 +1,267 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import connect4
+import connect4_mpi
+import lab3
+import playouts
+from connect4 import COMPUTER, PERSON
+
+# positions as the columns played from an empty board, the computer moves first
+SUITE = [
+    ("empty", ""),
+    ("center", "3"),
+    ("center-reply", "33"),
+    ("opening", "332244"),
+    ("stacked", "3333222"),
+    ("middlegame", "3243323414"),
+    ("crowded", "0123456012345603"),
+]
+
+
+# move and score of lab3's dfs on the suite at depth 4 and 5, from when its field was a string
+# array searched cell by cell; the faster boards have to find exactly the same
+LAB3_DFS = {
+    4: {"empty": (0, 0.0), "center": (0, 0.0), "center-reply": (0, 0.0), "opening": (1, 1),
+        "stacked": (3, 0.10787172011661807), "middlegame": (1, -0.06997084548104955),
+        "crowded": (3, 0.18950437317784255)},
+    5: {"empty": (0, 0.0), "center": (0, 0.0), "center-reply": (2, 0.07496876301541024), "opening": (1, 1),
+        "stacked": (3, 0.10787172011661807), "middlegame": (1, 0.00957934194085797),
+        "crowded": (3, 0.33483733629506224)},
+}
+
+
+def connect4_board(cls, moves):
+    board = cls()
+    player = COMPUTER
+
+    for move in moves:
+        board.play(int(move), player)
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    return board, player
+
+
+def lab3_board(moves):
+    board = lab3.Board(True)
+
+    for move in moves:
+        board.playTurn(int(move))
+
+    return board
+
+
+def perft(board, depth):
+    # leaf positions depth plies down, a winning move ends its line and counts as one leaf
+    if depth == 0:
+        return 1
+
+    player = COMPUTER if board.last_player() != COMPUTER else PERSON
+    nodes = 0
+
+    for move in type(board).valid_moves(board):
+        board.play(move, player)
+
+        if board.last_move_wins():
+            nodes += 1
+        else:
+            nodes += perft(board, depth - 1)
+
+        board.undo(move)
+
+    return nodes
+
+
+def lab3_perft(board, depth):
+    # same counting as perft
+    if depth == 0:
+        return 1
+
+    nodes = 0
+
+    for col in range(lab3.W):
+        ok, fin = board.playTurn(col)
+        if not ok:
+            continue
+
+        if fin:
+            nodes += 1
+        else:
+            nodes += lab3_perft(board, depth - 1)
+
+        board.revertTurn(col)
+
+    return nodes
+
+
+class CountingBoard(lab3.Board):
+    # lab3 keeps no node count, so count the moves dfs actually searches
+    nodes = 0
+
+    def searchMove(self, col, depth, maxDepth=lab3.maxDepth):
+        self.nodes += 1
+        return super().searchMove(col, depth, maxDepth)
+
+
+def peak_memory(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(run, seed, memory):
+    # the same seed before every run, minimax breaks ties with random.choice
+    random.seed(seed)
+    lab3.cache = lab3.Cache(lab3.cache.maxSize)
+
+    start_time = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start_time
+
+    peak = None
+    if memory:
+        random.seed(seed)
+        lab3.cache = lab3.Cache(lab3.cache.maxSize)
+        peak = peak_memory(run)
+
+    return result, seconds, peak
+
+
+def record(results, implementation, position, benchmark, depth, nodes, seconds, peak, **extra):
+    entry = {"implementation": implementation, "position": position[0], "moves": position[1],
+             "benchmark": benchmark, "depth": depth, "nodes": nodes, "seconds": seconds,
+             "nodes_per_second": nodes / seconds if seconds > 0 else None, "peak_memory": peak}
+    entry.update(extra)
+
+    results.append(entry)
+    sys.stderr.write("%s %s %s: %d nodes, %.3f s\n" % (implementation, benchmark, position[0], nodes, seconds))
+
+
+def run_connect4(results, implementation, cls, position, args):
+    board, player = connect4_board(cls, position[1])
+
+    nodes, seconds, peak = measure(lambda: perft(board, args.perft_depth), args.seed, args.memory)
+    record(results, implementation, position, "perft", args.perft_depth, nodes, seconds, peak)
+
+    for engine in ("minimax", "alphabeta"):
+        def search():
+            board.nodes = 0
+            if engine == "alphabeta":
+                move, score, _ = board.alphabeta(player, args.depth)
+            else:
+                move, score = board.minimax(player, args.depth)
+
+            return move, score, board.nodes
+
+        (move, score, nodes), seconds, peak = measure(search, args.seed, args.memory)
+        record(results, implementation, position, engine, args.depth, nodes, seconds, peak, move=move, score=score,
+               ms_per_move=seconds * 1000)
+
+    if cls is connect4.Board and args.playouts > 0:
+        # random games from the position, one at a time and as one numpy batch
+        def python_playouts():
+            generator = random.Random(args.seed)
+            for _ in range(args.playouts):
+                connect4.random_playout(board, player, generator)
+
+            return args.playouts
+
+        count, seconds, peak = measure(python_playouts, args.seed, args.memory)
+        record(results, implementation, position, "playouts", 0, count, seconds, peak)
+
+        count, seconds, peak = measure(lambda: len(playouts.playouts(board, player, args.playouts, args.seed)),
+                                       args.seed, args.memory)
+        record(results, implementation, position, "numpy-playouts", 0, count, seconds, peak)
+
+    if cls is connect4_mpi.Board:
+        # what a worker pays for the root every turn
+        def round_trip():
+            for _ in range(1000):
+                connect4_mpi.Board().deserialize(board.serialize())
+
+            return 1000
+
+        count, seconds, peak = measure(round_trip, args.seed, args.memory)
+        record(results, implementation, position, "serialize", 0, count, seconds, peak,
+               bytes=board.serialized_size())
+
+
+def run_lab3(results, position, args):
+    board = lab3_board(position[1])
+
+    nodes, seconds, peak = measure(lambda: lab3_perft(board, args.perft_depth), args.seed, args.memory)
+    record(results, "lab3", position, "perft", args.perft_depth, nodes, seconds, peak)
+
+    def search():
+        counting = CountingBoard(True)
+        counting.field = board.field.copy()
+        counting.heights = list(board.heights)
+        counting.counts = {piece: list(counts) for piece, counts in board.counts.items()}
+        counting.nextPiece = board.nextPiece
+
+        col, score = counting.gameSimulation(args.depth)
+
+        return col, score, counting.nodes
+
+    (col, score, nodes), seconds, peak = measure(search, args.seed, args.memory)
+    record(results, "lab3", position, "dfs", args.depth, nodes, seconds, peak, move=col, score=score,
+           ms_per_move=seconds * 1000)
+
+
+def parity(results):
+    # every implementation has to count the same perft nodes for a position, and lab3 has to
+    # search the same moves and scores as it always did
+    counts = {}
+    for entry in results:
+        if entry["benchmark"] == "perft":
+            counts.setdefault(entry["position"], set()).add(entry["nodes"])
+
+    searches = [entry for entry in results if entry["implementation"] == "lab3" and entry["benchmark"] == "dfs"
+                and entry["position"] in LAB3_DFS.get(entry["depth"], {})]
+
+    return {"perft": all(len(nodes) == 1 for nodes in counts.values()),
+            "lab3_dfs": all((entry["move"], entry["score"]) == LAB3_DFS[entry["depth"]][entry["position"]]
+                            for entry in searches)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft and fixed-depth search benchmarks, printed as JSON")
+    parser.add_argument("--perft-depth", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=4, help="depth of the fixed-depth searches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--playouts", type=int, default=1000, help="random games per position, 0 skips them")
+    parser.add_argument("--positions", nargs="*", help="names of the positions to run, all by default")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the second run that measures peak memory with tracemalloc")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    positions = [p for p in SUITE if args.positions is None or p[0] in args.positions]
+    results = []
+
+    for position in positions:
+        run_connect4(results, "connect4", connect4.Board, position, args)
+        run_connect4(results, "connect4_mpi", connect4_mpi.Board, position, args)
+        run_lab3(results, position, args)
+
+    report = {"python": platform.python_version(), "seed": args.seed, "perft_depth": args.perft_depth,
+              "depth": args.depth, "results": results, "parity": parity(results)}
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import time
+
+from connect4 import BOARD_HEIGHT, BOARD_WIDTH, COMPUTER, PERSON, OpeningBook
+from connect4_mpi import BinaryCodec, Board, Connect4MPI, write
+from transport import LocalTransport
+
+
+def expand(searcher, plies, entries):
+    # the computer plays its book move and the person any reply, so the book covers every position
+    # a game reaches while the computer is still in it
+    board = searcher.board
+    key = board.key(COMPUTER)
+
+    if sum(board.heights) >= plies or key in entries:
+        return
+
+    aggregated = searcher.search()
+    move = max(aggregated, key=aggregated.get)
+    entries[key] = (board.orient(move), aggregated[move])
+
+    write("Positions: " + str(len(entries)))
+
+    board.play(move, COMPUTER)
+
+    if not board.last_move_wins():
+        for reply in Board.valid_moves(board):
+            board.play(reply, PERSON)
+
+            if not board.last_move_wins() and len(Board.valid_moves(board)) > 0:
+                expand(searcher, plies, entries)
+
+            board.undo(reply)
+
+    board.undo(move)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an opening book with the parallel search")
+    parser.add_argument("output", help="file to write the book to")
+    parser.add_argument("--plies", type=int, default=6, help="pieces on the board up to which positions are kept")
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--engine", choices=["minimax", "alphabeta"], default="minimax")
+    parser.add_argument("--width", type=int, default=BOARD_WIDTH)
+    parser.add_argument("--height", type=int, default=BOARD_HEIGHT)
+    parser.add_argument("--local", type=int, metavar="PROCESSES",
+                        help="search on a local process pool instead of MPI ranks")
+    args = parser.parse_args()
+
+    transport = None
+    if args.local:
+        transport = LocalTransport(args.local, codec=BinaryCodec())
+
+    searcher = Connect4MPI(args.width, args.height, depth=args.depth, engine=args.engine, transport=transport)
+
+    if searcher.rank != 0:
+        searcher.do_worker()
+    else:
+        start_time = time.time()
+
+        entries = {}
+        searcher.board = Board(args.width, args.height)
+        expand(searcher, args.plies, entries)
+
+        OpeningBook.write(args.output, args.width, args.height, args.plies, args.depth, args.engine, entries)
+
+        searcher.transport.close()
+        write("Time taken: " + str(time.time() - start_time))
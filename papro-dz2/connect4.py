@@ -3,20 +3,23 @@
 # Press ⌃R to execute it or replace it with your code.
 # Press Double ⇧ to search everywhere for classes, files, tool windows, actions, and settings.
 import math
+import mmap
+import os
 import random
+import struct
+import threading
 import time
-from copy import deepcopy
+from collections import OrderedDict, namedtuple
 # from mpi4py import MPI
 import sys
 
-import numpy as np
-
 # size = MPI.COMM_WORLD.Get_size()
 # rank = MPI.COMM_WORLD.Get_rank()
 # name = MPI.Get_processor_name()
 
 BOARD_HEIGHT = 6
 BOARD_WIDTH = 7
+WIN_LENGTH = 4
 
 EMPTY, COMPUTER, PERSON = 0, 1, 2
 
@@ -25,23 +28,332 @@ def write(x):
     sys.stdout.write(x)
 
 
-class Node:
-    def __init__(self):
-        a = 0
+class SearchTimeout(Exception):
+    pass
+
+
+def read_in_background():
+    # input() blocks, so it runs on a thread while the engine ponders; done is set once it returns
+    line = []
+    done = threading.Event()
+
+    def read():
+        try:
+            line.append(input())
+        finally:
+            done.set()
+
+    threading.Thread(target=read, daemon=True).start()
+
+    return line, done
+
+
+# random keys are derived from the board size only, so every process that
+# builds a board of the same size agrees on the hash of a position
+zobrist_tables = {}
+
+
+def zobrist_keys(width, height):
+    if (width, height) not in zobrist_tables:
+        generator = random.Random("zobrist %dx%d" % (width, height))
+        cells = width * (height + 1)
+
+        side = generator.getrandbits(64)
+        computer = [generator.getrandbits(64) for _ in range(cells)]
+        person = [generator.getrandbits(64) for _ in range(cells)]
+
+        zobrist_tables[(width, height)] = (side, [None, computer, person])
+
+    return zobrist_tables[(width, height)]
+
+
+# how an alpha-beta score relates to the true value of the position
+EXACT, LOWER, UPPER = 0, 1, 2
+
+Entry = namedtuple("Entry", "key depth score move flag")
+
+
+class TranspositionTable:
+    def __init__(self, max_entries=1 << 20, policy="depth"):
+        if policy not in ("depth", "lru"):
+            raise Exception("Unknown replacement policy " + policy)
+
+        self.max_entries = max_entries
+        self.policy = policy
+
+        if policy == "depth":
+            # fixed slots, a colliding entry only replaces a shallower one
+            self.slots = [None] * max_entries
+        else:
+            self.slots = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        if self.policy == "depth":
+            return self.stores - self.evictions
+
+        return len(self.slots)
+
+    def get(self, key):
+        if self.policy == "depth":
+            entry = self.slots[key % self.max_entries]
+            if entry is not None and entry.key != key:
+                entry = None
+        else:
+            entry = self.slots.get(key)
+            if entry is not None:
+                self.slots.move_to_end(key)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return entry
+
+    def put(self, key, depth, score, move, flag=EXACT):
+        entry = Entry(key, depth, score, move, flag)
+
+        if self.policy == "depth":
+            index = key % self.max_entries
+            old = self.slots[index]
+
+            if old is None:
+                self.stores += 1
+            elif old.key != key:
+                if old.depth > depth:
+                    return
+                self.evictions += 1
+                self.stores += 1
+
+            self.slots[index] = entry
+            return
+
+        if key in self.slots:
+            self.slots.move_to_end(key)
+        else:
+            self.stores += 1
+            if len(self.slots) >= self.max_entries:
+                self.slots.popitem(last=False)
+                self.evictions += 1
+
+        self.slots[key] = entry
+
+    def clear(self):
+        if self.policy == "depth":
+            self.slots = [None] * self.max_entries
+        else:
+            self.slots.clear()
+
+        self.stores = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "stores": self.stores, "evictions": self.evictions}
+
+
+# magic, columns, rows, plies, search depth, engine name and the number of entries, then the
+# entries sorted by key: position hash, best move and its score
+BOOK_HEADER = struct.Struct("<4sBBBB16sI")
+BOOK_ENTRY = struct.Struct("<Qbd")
+BOOK_MAGIC = b"C4OB"
+
+
+class OpeningBook:
+    # read-only and memory-mapped, so opening it costs nothing and only the pages a lookup
+    # touches are read; the positions are the ones with the computer to move
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.columns, self.rows, self.plies, self.depth, engine, self.count = \
+            BOOK_HEADER.unpack_from(self.data)
+        if magic != BOOK_MAGIC:
+            raise Exception("Not an opening book: " + path)
+
+        self.engine = engine.rstrip(b"\0").decode()
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, index):
+        return BOOK_ENTRY.unpack_from(self.data, BOOK_HEADER.size + index * BOOK_ENTRY.size)
+
+    def get(self, board):
+        # binary search over the sorted keys, None if the position is not in the book
+        if board.columns != self.columns or board.rows != self.rows:
+            return None
+
+        key = board.key(COMPUTER)
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, move, score = self.entry(middle)
+
+            if entry_key == key:
+                return board.orient(move), score
+            elif entry_key < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    @staticmethod
+    def write(path, columns, rows, plies, depth, engine, entries):
+        # entries maps a position key to its best move, as Board.orient stores it, and its score
+        with open(path, "wb") as file:
+            file.write(BOOK_HEADER.pack(BOOK_MAGIC, columns, rows, plies, depth, engine.encode(), len(entries)))
+
+            for key in sorted(entries):
+                move, score = entries[key]
+                file.write(BOOK_ENTRY.pack(key, move, score))
+
+
+# magic, columns and rows, then the entries in the order they were solved, laid out like the
+# book's: position key, best move and its exact score
+TABLEBASE_HEADER = struct.Struct("<4sBB")
+TABLEBASE_MAGIC = b"C4TB"
+
+
+class Tablebase:
+    # positions Board.solve worked out, for any player to move; the whole file is read into a dict
+    # and the file only grows, every save appends what was solved since the last one. A run killed
+    # in the middle of a save leaves a file cut short: without a whole header it is a new tablebase
+    # and a partial entry at the end is dropped, size is where the whole entries end
+    def __init__(self, path, columns=BOARD_WIDTH, rows=BOARD_HEIGHT):
+        self.path = path
+        self.columns, self.rows = columns, rows
+        self.entries = {}
+        self.new = {}
+        self.size = 0
+
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                data = file.read()
+
+            if len(data) >= TABLEBASE_HEADER.size:
+                magic, self.columns, self.rows = TABLEBASE_HEADER.unpack_from(data)
+                if magic != TABLEBASE_MAGIC:
+                    raise Exception("Not a tablebase: " + path)
+
+                self.size = len(data) - (len(data) - TABLEBASE_HEADER.size) % BOOK_ENTRY.size
+
+            for offset in range(TABLEBASE_HEADER.size, self.size, BOOK_ENTRY.size):
+                key, move, score = BOOK_ENTRY.unpack_from(data, offset)
+                self.entries[key] = (move, score)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, board, player):
+        if board.columns != self.columns or board.rows != self.rows:
+            return None
+
+        entry = self.entries.get(board.key(player))
+        if entry is None:
+            return None
+
+        return board.orient(entry[0]), entry[1]
+
+    def put(self, board, player, move, score):
+        if board.columns != self.columns or board.rows != self.rows:
+            return
+
+        key = board.key(player)
+        if key not in self.entries:
+            self.entries[key] = self.new[key] = (board.orient(move), score)
+
+    def save(self):
+        if len(self.new) == 0:
+            return
+
+        with open(self.path, "ab") as file:
+            file.truncate(self.size)
+            if self.size == 0:
+                file.write(TABLEBASE_HEADER.pack(TABLEBASE_MAGIC, self.columns, self.rows))
+
+            for key, (move, score) in self.new.items():
+                file.write(BOOK_ENTRY.pack(key, move, score))
+
+            self.size = file.tell()
+
+        self.new = {}
 
 
 class Board:
     def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT):
         self.columns = width
         self.rows = height
-        self.board = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), int)
+
+        # every column gets one extra (always empty) bit on top so that shifted
+        # lines never wrap from the top of one column into the next one
+        self.stride = height + 1
+
+        # one bitboard per player, indexed by COMPUTER and PERSON
+        self.masks = [0, 0, 0]
+        self.heights = [0] * width
+
+        # columns played so far, the last one holds the most recent piece
+        self.moves = []
+
+        # Zobrist hash of the pieces, updated on every play and undo, and the hash of the same
+        # pieces with the columns mirrored left to right
+        self.side_key, self.zobrist = zobrist_keys(width, height)
+        self.hash = 0
+        self.mirror_hash = 0
+
+        # alpha-beta tries the center columns first
+        self.order = sorted(range(width), key=lambda c: abs(2 * c - width + 1))
+        self.killers = []
+        self.nodes = 0
+
+        # searches raise SearchTimeout once time.time() passes this or once this event is set
+        self.deadline = None
+        self.stop = None
 
     def __copy__(self):
         new = type(self)(self.columns, self.rows)
-        new.board = deepcopy(self.board)
+        new.masks = list(self.masks)
+        new.heights = list(self.heights)
+        new.moves = list(self.moves)
+        new.hash = self.hash
+        new.mirror_hash = self.mirror_hash
 
         return new
 
+    def __getstate__(self):
+        # the Zobrist keys are shared by every board of this size, so they are not pickled
+        state = dict(self.__dict__)
+        del state["side_key"]
+        del state["zobrist"]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.side_key, self.zobrist = zobrist_keys(self.columns, self.rows)
+
+    def get(self, row, column):
+        bit = 1 << (column * self.stride + row)
+
+        if self.masks[COMPUTER] & bit:
+            return COMPUTER
+        elif self.masks[PERSON] & bit:
+            return PERSON
+
+        return EMPTY
+
     def __str__(self):
         str = ""
         for r in reversed(range(self.rows)):
@@ -50,7 +362,7 @@ class Board:
                 if c == 0:
                     str += '| '
 
-                player = self.board[r, c]
+                player = self.get(r, c)
                 if player == EMPTY:
                     player = " "
 
@@ -66,41 +378,111 @@ class Board:
         if column >= self.columns:
             raise Exception("Column out of range")
 
-        for row in range(self.rows):
-            if self.board[row, column] == EMPTY:
-                self.board[row, column] = player
-                return
-
-        raise Exception("Height out of range")
+        row = self.heights[column]
+        if row >= self.rows:
+            raise Exception("Height out of range")
+
+        position = column * self.stride + row
+        self.masks[player] |= 1 << position
+        self.hash ^= self.zobrist[player][position]
+        self.mirror_hash ^= self.zobrist[player][(self.columns - 1 - column) * self.stride + row]
+        self.heights[column] = row + 1
+        self.moves.append(column)
+
+    def undo(self, column):
+        row = self.heights[column] - 1
+        if row < 0:
+            raise Exception("Column is empty")
+
+        position = column * self.stride + row
+        player = self.get(row, column)
+        self.masks[player] &= ~(1 << position)
+        self.hash ^= self.zobrist[player][position]
+        self.mirror_hash ^= self.zobrist[player][(self.columns - 1 - column) * self.stride + row]
+        self.heights[column] = row
+        self.moves.pop()
 
     def is_win(self, player):
-        # check horizontal lines
-        for c in range(self.columns - 3):
-            for r in range(self.rows):
-                if (self.board[r, c] == player and self.board[r, c + 1] == player
-                        and self.board[r, c + 2] == player and self.board[r, c + 3] == player):
-                    return True
-
-        # check columns
-        for c in range(self.columns):
-            for r in range(self.rows - 3):
-                if (self.board[r, c] == player and self.board[r + 1, c] == player
-                        and self.board[r + 2, c] == player and self.board[r + 3, c] == player):
-                    return True
-
-        # check rising diagonals
-        for c in range(self.columns - 3):
-            for r in range(self.rows - 3):
-                if (self.board[r, c] == player and self.board[r + 1, c + 1] == player
-                        and self.board[r + 2, c + 2] == player and self.board[r + 3, c + 3] == player):
-                    return True
-
-        # check falling diagonals
-        for c in range(self.columns - 3):
-            for r in range(3, self.rows):
-                if (self.board[r, c] == player and self.board[r - 1, c + 1] == player
-                        and self.board[r - 2, c + 2] == player and self.board[r - 3, c + 3] == player):
-                    return True
+        mask = self.masks[player]
+
+        # vertical, horizontal, falling and rising diagonal neighbours
+        for shift in (1, self.stride, self.stride - 1, self.stride + 1):
+            pairs = mask & (mask >> shift)
+            if pairs & (pairs >> (2 * shift)):
+                return True
+
+        return False
+
+    def rewind(self, length):
+        # take back moves until only the first `length` are left
+        while len(self.moves) > length:
+            self.undo(self.moves[-1])
+
+    def tick(self):
+        self.nodes += 1
+
+        # looking at the clock is slow, so only do it every 1024 nodes
+        if self.nodes & 1023 == 0:
+            if self.deadline is not None and time.time() > self.deadline:
+                raise SearchTimeout()
+
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout()
+
+    def key(self, player):
+        # the same pieces with a different player to move are a different node; a position and
+        # its mirror image score the same, so they share the smaller of their two hashes
+        key = min(self.hash, self.mirror_hash)
+
+        if player == PERSON:
+            return key ^ self.side_key
+
+        return key
+
+    def orient(self, move):
+        # moves stored under key are for the position whose hash it is, this turns them into moves
+        # on this board and back
+        if move is None or self.mirror_hash >= self.hash:
+            return move
+
+        return self.columns - 1 - move
+
+    def is_symmetric(self):
+        return self.hash == self.mirror_hash
+
+    def last_player(self):
+        if not self.moves:
+            return EMPTY
+
+        column = self.moves[-1]
+        return self.get(self.heights[column] - 1, column)
+
+    def last_move_wins(self):
+        # only lines through the most recent piece can have been completed,
+        # so walk at most WIN_LENGTH - 1 cells each way from it
+        if not self.moves:
+            return False
+
+        column = self.moves[-1]
+        row = self.heights[column] - 1
+        position = column * self.stride + row
+        mask = self.masks[self.get(row, column)]
+
+        for shift in (1, self.stride, self.stride - 1, self.stride + 1):
+            length = 1
+
+            bit = position - shift
+            while length < WIN_LENGTH and bit >= 0 and mask >> bit & 1:
+                length += 1
+                bit -= shift
+
+            bit = position + shift
+            while length < WIN_LENGTH and mask >> bit & 1:
+                length += 1
+                bit += shift
+
+            if length >= WIN_LENGTH:
+                return True
 
         return False
 
@@ -109,7 +491,7 @@ class Board:
         moves = []
 
         for c in range(board.columns):
-            if board.board[board.rows - 1, c] == EMPTY:
+            if board.heights[c] < board.rows:
                 moves.append(c)
 
         return moves
@@ -119,7 +501,7 @@ class Board:
         moves = 0
 
         for c in range(board.columns):
-            if board.board[board.rows - 1, c] == EMPTY:
+            if board.heights[c] < board.rows:
                 moves += 1
 
         return moves
@@ -128,10 +510,12 @@ class Board:
     def minimax(board, player, depth):
         return board.minimax(player, depth)
 
-    def minimax(self, player, depth):
-        if self.is_win(COMPUTER):
-            return None, 1
-        elif self.is_win(PERSON):
+    def minimax(self, player, depth, table=None):
+        self.tick()
+
+        if self.last_move_wins():
+            if self.last_player() == COMPUTER:
+                return None, 1
             return None, -1
 
         valid_moves = Board.valid_moves(self)
@@ -140,6 +524,14 @@ class Board:
             # nothing left to play, nobody won
             return None, 0
 
+        if table is not None:
+            key = self.key(player)
+            entry = table.get(key)
+
+            # averaged scores change with depth, so only an exact match will do
+            if entry is not None and entry.depth == depth:
+                return self.orient(entry.move), entry.score
+
         # Max player - COMPUTER
         if player == COMPUTER:
             value = -1
@@ -147,45 +539,485 @@ class Board:
             best_move = random.choice(valid_moves)
 
             for move in valid_moves:
-                new_board = self.__copy__()
-                new_board.play(move, COMPUTER)
+                self.play(move, COMPUTER)
+                _, new_score = self.minimax(PERSON, depth - 1, table)
+                self.undo(move)
 
-                _, new_score = new_board.minimax(PERSON, depth - 1)
                 new_score /= len(valid_moves)
 
                 if new_score > value:
                     value = new_score
                     best_move = move
 
-            return best_move, value
-
         # Min player - PERSON
-        if player == PERSON:
+        elif player == PERSON:
             value = 1
 
             best_move = random.choice(valid_moves)
 
             for move in valid_moves:
-                new_board = self.__copy__()
-                new_board.play(move, PERSON)
+                self.play(move, PERSON)
+                _, new_score = self.minimax(COMPUTER, depth - 1, table)
+                self.undo(move)
 
-                _, new_score = new_board.minimax(COMPUTER, depth - 1)
                 new_score /= len(valid_moves)
 
                 if new_score < value:
                     value = new_score
                     best_move = move
 
-            return best_move, value
+        if table is not None:
+            table.put(key, depth, value, self.orient(best_move))
+
+        return best_move, value
+
+    def alphabeta(self, player, depth, table=None, first_move=None):
+        start_nodes = self.nodes
+
+        # the root never cuts off, so its killer slot holds the move to try first
+        self.killers = [None] * (depth + 1)
+        self.killers[0] = first_move
+
+        move, score = self.negamax(player, depth, -math.inf, math.inf, 0, table)
+
+        # same convention as minimax: positive is good for the computer
+        if player == PERSON:
+            score = -score
+
+        return move, score / (self.columns * self.rows), self.nodes - start_nodes
+
+    def solve(self, player, table=None):
+        # the exact score of the position, on the same scale as alphabeta: null-window searches
+        # of the whole remaining tree halve the range the score can be in until one is left,
+        # then one more just below it finds a move that gets it
+        empty = self.columns * self.rows - sum(self.heights)
+        self.killers = [None] * (empty + 1)
+        low, high = -empty, empty
+
+        while low < high:
+            middle = (low + high) // 2
+            _, score = self.negamax(player, empty, middle, middle + 1, 0, table)
+
+            if score > middle:
+                low = middle + 1
+            else:
+                high = middle
+
+        move, _ = self.negamax(player, empty, low - 1, low, 0, table)
+
+        score = low if player == COMPUTER else -low
+        return move, score / (self.columns * self.rows)
+
+    def negamax(self, player, depth, alpha, beta, ply, table=None):
+        self.tick()
+
+        if self.last_move_wins():
+            # the player to move has lost, sooner is worse
+            return None, -(self.columns * self.rows - sum(self.heights) + 1)
+
+        moves = [c for c in self.order if self.heights[c] < self.rows]
+
+        if len(moves) == 0 or depth == 0:
+            return None, 0
+
+        first_moves = []
+        original_alpha = alpha
+
+        if table is not None:
+            key = self.key(player)
+            entry = table.get(key)
+
+            if entry is not None:
+                if entry.depth >= depth:
+                    if entry.flag == EXACT:
+                        return self.orient(entry.move), entry.score
+                    elif entry.flag == LOWER:
+                        alpha = max(alpha, entry.score)
+                    else:
+                        beta = min(beta, entry.score)
+
+                    if alpha >= beta:
+                        return self.orient(entry.move), entry.score
+
+                first_moves.append(self.orient(entry.move))
+
+        killer = self.killers[ply]
+        if killer is not None:
+            first_moves.append(killer)
+
+        for move in reversed(first_moves):
+            if move in moves:
+                moves.remove(move)
+                moves.insert(0, move)
+
+        opponent = PERSON if player == COMPUTER else COMPUTER
+        best_move, value = moves[0], -math.inf
+
+        for move in moves:
+            self.play(move, player)
+            _, score = self.negamax(opponent, depth - 1, -beta, -alpha, ply + 1, table)
+            self.undo(move)
+
+            score = -score
+            if score > value:
+                value = score
+                best_move = move
+
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.killers[ply] = move
+                break
+
+        if table is not None:
+            if value <= original_alpha:
+                flag = UPPER
+            elif value >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+
+            table.put(key, depth, value, self.orient(best_move), flag)
+
+        return best_move, value
+
+
+# playouts per move when mcts is given neither iterations nor a time limit
+MCTS_ITERATIONS = 5000
+
+# entries of the table the endgame solver uses when no table size is given; its bounds are only good
+# for whole-tree searches, so it is not shared with the fixed-depth engines
+SOLVE_TABLE_SIZE = 1 << 18
+
+
+def random_playout(board, player, generator):
+    # random moves from the position until somebody wins or the board is full, +1 if the
+    # computer won and -1 if the person did; the board is left as it was
+    length = len(board.moves)
+    result = 0
+
+    while sum(board.heights) < board.columns * board.rows:
+        moves = [c for c in range(board.columns) if board.heights[c] < board.rows]
+        board.play(generator.choice(moves), player)
+
+        if board.last_move_wins():
+            result = 1 if player == COMPUTER else -1
+            break
+
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    board.rewind(length)
+
+    return result
+
+
+class Node:
+    def __init__(self, parent, move, player, board):
+        self.parent = parent
+        self.move = move
+        self.player = player
+        self.children = []
+
+        # playouts through this node and the sum of their results, +1 a computer win
+        self.visits = 0
+        self.value = 0
+
+        # +1, -1 or 0 once the move that led here ends the game, None while it goes on
+        self.result = None
+        if move is not None and board.last_move_wins():
+            self.result = 1 if player == COMPUTER else -1
+        elif sum(board.heights) == board.columns * board.rows:
+            self.result = 0
+
+        self.untried = [] if self.result is not None else [c for c in board.order if board.heights[c] < board.rows]
+
+    def to_move(self):
+        return PERSON if self.player == COMPUTER else COMPUTER
+
+    def select(self, exploration):
+        # UCT, the value is what the player to move gets out of the child
+        sign = 1 if self.to_move() == COMPUTER else -1
+        log_visits = math.log(self.visits)
+
+        return max(self.children, key=lambda child: sign * child.value / child.visits
+                   + exploration * math.sqrt(log_visits / child.visits))
+
+
+class MCTS:
+    def __init__(self, exploration=math.sqrt(2), seed=None, reuse=True):
+        self.exploration = exploration
+        self.random = random.Random(seed)
+
+        # with reuse the tree below the moves played since the last search is kept
+        self.reuse = reuse
+        self.root = None
+        self.board = None
+
+    def find(self, board):
+        # the node for board among the old root and the two plies below it, None if it is not there
+        if self.root is None or not self.reuse:
+            return None
+
+        old = self.board.__copy__()
+        nodes = [(self.root, [])]
+
+        for node, path in nodes:
+            for step in path:
+                old.play(step.move, step.player)
+
+            found = old.masks == board.masks
+            old.rewind(len(self.board.moves))
+
+            if found:
+                return node
+
+            if len(path) < 2:
+                nodes.extend((child, path + [child]) for child in node.children)
+
+        return None
+
+    def start(self, board, player):
+        node = self.find(board)
+
+        if node is None or node.to_move() != player:
+            # the root stands for the move that led to the position, made by the other player
+            node = Node(None, None, PERSON if player == COMPUTER else COMPUTER, board)
+
+        node.parent = None
+        self.root = node
+        self.board = board.__copy__()
+
+    def descend(self, board):
+        # follows UCT down from the root playing the moves on board, expanding one new child
+        node = self.root
+
+        while len(node.untried) == 0 and len(node.children) > 0:
+            node = node.select(self.exploration)
+            board.play(node.move, node.player)
+
+        if len(node.untried) > 0:
+            move = node.untried.pop(0)
+            player = node.to_move()
+            board.play(move, player)
+
+            child = Node(node, move, player, board)
+            node.children.append(child)
+            node = child
+
+        return node
+
+    def backpropagate(self, node, value, visits=1):
+        while node is not None:
+            node.visits += visits
+            node.value += value
+            node = node.parent
+
+    def virtual_loss(self, node, visits):
+        # counts visits through node as lost for whoever made each move, so the next descent goes
+        # elsewhere while the node waits for its playouts; -visits takes them back
+        while node is not None:
+            node.visits += visits
+            node.value += -visits if node.player == COMPUTER else visits
+            node = node.parent
+
+    def discard(self, node):
+        # a new leaf that never got its playouts goes back to the untried moves of its parent
+        node.parent.children.remove(node)
+        node.parent.untried.insert(0, node.move)
+
+    def search(self, board, player, iterations=None, time_limit=None):
+        # anytime: runs until the iterations or the time are used up, whichever comes first, or
+        # until board.stop is set, which raises SearchTimeout; returns the playouts it ran. One
+        # playout always runs, so the root has a move to pick even when the time is already up
+        self.start(board, player)
+
+        deadline = time.time() + time_limit if time_limit is not None else None
+        length = len(board.moves)
+        count = 0
+
+        while iterations is None or count < iterations:
+            if deadline is not None and count > 0 and time.time() > deadline:
+                break
+
+            if board.stop is not None and board.stop.is_set():
+                raise SearchTimeout()
+
+            node = self.descend(board)
+
+            if node.result is not None:
+                value = node.result
+            else:
+                value = random_playout(board, node.to_move(), self.random)
+
+            board.rewind(length)
+            self.backpropagate(node, value)
+            count += 1
+
+        return count
+
+    def statistics(self, columns):
+        # visits and summed results of every root move, indexed by column
+        visits, values = [0] * columns, [0] * columns
+
+        for child in self.root.children:
+            visits[child.move] = child.visits
+            values[child.move] = child.value
+
+        return visits, values
+
+    def best_move(self):
+        # the most visited move, the value alone is noisy for moves tried a few times
+        child = max(self.root.children, key=lambda child: child.visits)
+
+        return child.move, child.value / child.visits
 
 
 class Connect4:
-    def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT, depth=2):
+    def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT, depth=2, table_size=None, table_policy="depth",
+                 engine="minimax", time_limit=None, ponder=False, book=None, iterations=None, reuse_tree=True,
+                 solve_below=None, tablebase=None):
+        if engine not in ("minimax", "alphabeta", "mcts"):
+            raise Exception("Unknown engine " + engine)
+
         self.board = Board(width, height)
         self.depth = depth
+        self.engine = engine
+
+        # with a time limit (in seconds) depth is ignored and the search deepens until time runs out;
+        # depth_reached is how deep the last such search got
+        self.time_limit = time_limit
+        self.depth_reached = None
+
+        # mcts ignores depth, it plays random games until it has run the iterations or the time limit
+        # is up, keeping the tree from one move to the next with reuse_tree
+        self.iterations = iterations
+        if engine == "mcts" and iterations is None and time_limit is None:
+            self.iterations = MCTS_ITERATIONS
+        self.tree = MCTS(reuse=reuse_tree) if engine == "mcts" else None
+
+        self.table = None
+        if table_size:
+            self.table = TranspositionTable(table_size, table_policy)
+
+        # search the replies to the person's moves while they type theirs, keyed by their move
+        self.ponder = ponder
+        self.pondered = {}
+
+        # path of an opening book made by book.py, positions in it are not searched
+        self.book = OpeningBook(book) if book is not None else None
+
+        # positions with at most solve_below empty cells are solved exactly, whatever the engine and
+        # the time limit, and kept in the tablebase at that path for the next games
+        self.solve_below = solve_below
+        self.solve_table = TranspositionTable(table_size or SOLVE_TABLE_SIZE) if solve_below is not None else None
+        self.tablebase = Tablebase(tablebase, width, height) if tablebase is not None else None
+
+    def book_move(self):
+        if self.book is None:
+            return None
+
+        return self.book.get(self.board)
+
+    def search(self, player):
+        self.board.nodes = 0
+
+        empty = self.board.columns * self.board.rows - sum(self.board.heights)
+        if self.solve_below is not None and empty <= self.solve_below:
+            return self.solve(player)
+
+        if self.engine == "mcts":
+            self.board.nodes = self.tree.search(self.board, player, self.iterations, self.time_limit)
+
+            return self.tree.best_move()
+
+        if self.time_limit is not None:
+            return self.deepen(player)
+
+        return self.search_depth(player, self.depth)
+
+    def solve(self, player):
+        if self.tablebase is not None:
+            entry = self.tablebase.get(self.board, player)
+            if entry is not None:
+                return entry
+
+        move, score = self.board.solve(player, self.solve_table)
+
+        if self.tablebase is not None:
+            self.tablebase.put(self.board, player, move, score)
+            self.tablebase.save()
+
+        return move, score
+
+    def search_depth(self, player, depth, first_move=None):
+        if self.engine == "alphabeta":
+            move, score, _ = self.board.alphabeta(player, depth, self.table, first_move)
+
+            return move, score
+
+        return self.board.minimax(player, depth, self.table)
+
+    def deepen(self, player):
+        board = self.board
+        length = len(board.moves)
+
+        # fallback in case not even the first iteration finishes in time
+        moves = [c for c in board.order if board.heights[c] < board.rows]
+        best_move, best_score = moves[0], 0
+
+        board.deadline = time.time() + self.time_limit
+        depth = 0
+
+        try:
+            while depth < board.columns * board.rows - sum(board.heights):
+                best_move, best_score = self.search_depth(player, depth + 1, best_move)
+                depth += 1
+        except SearchTimeout:
+            board.rewind(length)
+        finally:
+            board.deadline = None
+
+        self.depth_reached = depth
+
+        return best_move, best_score
+
+    def ponder_moves(self):
+        # most likely moves first, a reply is only kept if its search finished before the person's
+        # move came in, so it is what search would have returned
+        line, typed = read_in_background()
+
+        board = self.board
+        length = len(board.moves)
+        self.pondered = {}
+
+        board.stop = typed
+        try:
+            for move in [c for c in board.order if board.heights[c] < board.rows]:
+                board.play(move, PERSON)
+
+                if (not board.last_move_wins() and len(board.moves) < board.columns * board.rows
+                        and self.book_move() is None):
+                    reply = self.search(COMPUTER)
+                    if typed.is_set():
+                        break
+
+                    self.pondered[move] = (reply, board.nodes)
+
+                board.undo(move)
+        except SearchTimeout:
+            pass
+        finally:
+            board.rewind(length)
+            board.stop = None
+
+        typed.wait()
+        if len(line) == 0:
+            raise EOFError()
+
+        return int(line[0])
 
     def play(self):
         player = COMPUTER
+        move = None
 
         win = False
         print(self.board)
@@ -194,15 +1026,31 @@ class Connect4:
             if player == COMPUTER:
                 start_time = time.time()
                 print("COMPUTER PLAYING")
-                move, score = self.board.minimax(COMPUTER, self.depth)
+
+                book_move = self.book_move()
+
+                if book_move is not None:
+                    write("Book move\n")
+                    (move, score), self.board.nodes = book_move, 0
+                elif move in self.pondered:
+                    (move, score), self.board.nodes = self.pondered[move]
+                else:
+                    self.depth_reached = None
+                    move, score = self.search(COMPUTER)
+                    if self.depth_reached is not None:
+                        write("Depth reached: " + str(self.depth_reached) + "\n")
+                self.pondered = {}
 
                 end_time = time.time()
                 write("Time taken: " + str(end_time - start_time))
+                write(" Nodes: " + str(self.board.nodes))
+                if self.table is not None:
+                    write(" Table: " + str(self.table.stats()))
 
                 self.board.play(move, COMPUTER)
 
                 print(self.board)
-                if self.board.is_win(COMPUTER):
+                if self.board.last_move_wins():
                     print("Computer won")
                     break
 
@@ -211,20 +1059,21 @@ class Connect4:
 
             elif player == PERSON:
                 print("YOU PLAY")
-                move = int(input())
+                move = self.ponder_moves() if self.ponder else int(input())
 
                 self.board.play(move, PERSON)
 
                 print(self.board)
-                if self.board.is_win(PERSON):
+                if self.board.last_move_wins():
                     print("You won")
                     break
 
                 player=COMPUTER
 
-connect4 = Connect4(depth=6)
+if __name__ == "__main__":
+    connect4 = Connect4(depth=6)
 
-connect4.play()
+    connect4.play()
 #board = Board()
 #board.play(0, PERSON)
 #board.play(0, PERSON)
@@ -1,14 +1,15 @@
+import argparse
+import math
 import random
-from copy import deepcopy
-from mpi4py import MPI
+import struct
 import sys
 import time
-import numpy as np
 
-BOARD_HEIGHT = 6
-BOARD_WIDTH = 7
-
-EMPTY, COMPUTER, PERSON = 0, 1, 2
+import connect4
+from connect4 import (BOARD_HEIGHT, BOARD_WIDTH, COMPUTER, MCTS, MCTS_ITERATIONS, PERSON, OpeningBook, SearchTimeout,
+                      Tablebase, TranspositionTable, read_in_background)
+from playouts import playouts
+from transport import LocalTransport, MPITransport
 
 
 def write(x):
@@ -17,251 +18,620 @@ def write(x):
     sys.stdout.flush()
 
 
-class Board:
-    def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT):
-        self.columns = width
-        self.rows = height
-        self.board = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), int)
+# columns, rows, last column played (-1 for none), then both bitboards
+BOARD_HEADER = struct.Struct("<BBb")
+
 
-    def __copy__(self):
-        new = type(self)(self.columns, self.rows)
-        new.board = deepcopy(self.board)
+class Board(connect4.Board):
+    def mask_size(self):
+        return (self.columns * self.stride + 7) // 8
 
-        return new
+    def serialize(self):
+        last = self.moves[-1] if len(self.moves) > 0 else -1
+        size = self.mask_size()
 
-    def __str__(self):
-        str = ""
-        for r in reversed(range(self.rows)):
-            str += "----" * self.columns + "-" + "\n"
-            for c in range(self.columns):
-                if c == 0:
-                    str += '| '
+        return (BOARD_HEADER.pack(self.columns, self.rows, last)
+                + self.masks[COMPUTER].to_bytes(size, "little")
+                + self.masks[PERSON].to_bytes(size, "little"))
 
-                player = self.board[r, c]
-                if player == EMPTY:
-                    player = " "
+    def deserialize(self, string):
+        columns, rows, last = BOARD_HEADER.unpack_from(string)
+        self.__init__(columns, rows)
+
+        size = self.mask_size()
+        offset = BOARD_HEADER.size
+
+        for player in (COMPUTER, PERSON):
+            mask = int.from_bytes(string[offset:offset + size], "little")
+            offset += size
+
+            self.masks[player] = mask
+            for position in range(self.columns * self.stride):
+                if mask >> position & 1:
+                    column, row = divmod(position, self.stride)
+                    self.hash ^= self.zobrist[player][position]
+                    self.mirror_hash ^= self.zobrist[player][(self.columns - 1 - column) * self.stride + row]
+
+        # the pieces of a column sit at the bottom, so its height is the length of its bits
+        column_mask = (1 << self.stride) - 1
+        pieces = self.masks[COMPUTER] | self.masks[PERSON]
+        for c in range(self.columns):
+            self.heights[c] = (pieces >> (c * self.stride) & column_mask).bit_length()
 
-                str += player.__str__() + " | "
+        # only the last move is kept, which is all last_move_wins needs
+        if last >= 0:
+            self.moves = [last]
 
-            str += "\n"
+        return self
 
-        str += "----" * self.columns + "-" + "\n"
+    def serialized_size(self):
+        return BOARD_HEADER.size + 2 * self.mask_size()
 
-        return str
 
-    def play(self, column, player):
-        if column >= self.columns:
-            raise Exception("Column out of range")
+# mcts is a whole tree search from the root on one worker, playouts a batch of random games from
+# a leaf of the tree the master keeps and solve the exact score of an endgame position
+ENGINES = ["minimax", "alphabeta", "mcts", "playouts", "solve"]
 
-        for row in range(self.rows):
-            if self.board[row, column] == EMPTY:
-                self.board[row, column] = player
-                return
+# engine, depth, time limit (NaN for none), playouts (0 for no limit), random seed and the number
+# of prefix moves; depth and the number of moves take two bytes, an exact solve of a large board
+# searches more than 255 plies deep. The moves themselves are a byte each, like the board width
+TASK_HEADER = struct.Struct("<BHdIIH")
 
-        raise Exception("Height out of range")
+# cancelled flag, best move (-1 for none), score, cache hits and misses, nodes searched, the number
+# of prefix moves and of columns with mcts statistics
+RESULT_HEADER = struct.Struct("<BhdIIIHH")
 
-    def is_win(self, player):
-        # check horizontal lines
-        for c in range(self.columns - 3):
-            for r in range(self.rows):
-                if (self.board[r, c] == player and self.board[r, c + 1] == player
-                        and self.board[r, c + 2] == player and self.board[r, c + 3] == player):
-                    return True
+# visits and summed results of a root move, after the prefix moves
+COLUMN_STATS = struct.Struct("<Id")
 
-        # check columns
-        for c in range(self.columns):
-            for r in range(self.rows - 3):
-                if (self.board[r, c] == player and self.board[r + 1, c] == player
-                        and self.board[r + 2, c] == player and self.board[r + 3, c] == player):
-                    return True
-
-        # check rising diagonals
-        for c in range(self.columns - 3):
-            for r in range(self.rows - 3):
-                if (self.board[r, c] == player and self.board[r + 1, c + 1] == player
-                        and self.board[r + 2, c + 2] == player and self.board[r + 3, c + 3] == player):
-                    return True
-
-        # check falling diagonals
-        for c in range(self.columns - 3):
-            for r in range(3, self.rows):
-                if (self.board[r, c] == player and self.board[r - 1, c + 1] == player
-                        and self.board[r - 2, c + 2] == player and self.board[r - 3, c + 3] == player):
-                    return True
-
-        return False
 
+class BinaryCodec:
+    # a handful of bytes per task instead of a pickled dict, the board is only sent once per turn
     @staticmethod
-    def valid_moves(board):
-        moves = []
+    def encode_task(task):
+        time_limit = task["time_limit"] if task["time_limit"] is not None else math.nan
+        moves = task["moves"]
 
-        for c in range(board.columns):
-            if board.board[board.rows - 1, c] == EMPTY:
-                moves.append(c)
+        return (TASK_HEADER.pack(ENGINES.index(task["engine"]), task["depth"], time_limit,
+                                 task.get("iterations", 0), task.get("seed", 0), len(moves))
+                + bytes(moves))
 
-        return moves
+    @staticmethod
+    def decode_task(data):
+        engine, depth, time_limit, iterations, seed, length = TASK_HEADER.unpack_from(data)
+        moves = tuple(data[TASK_HEADER.size:TASK_HEADER.size + length])
+
+        return {"moves": moves, "type": "minimax", "engine": ENGINES[engine], "depth": depth,
+                "time_limit": None if math.isnan(time_limit) else time_limit, "iterations": iterations,
+                "seed": seed}
 
     @staticmethod
-    def number_of_moves(board):
-        moves = 0
+    def encode_result(result):
+        cancelled = result["type"] == "cancelled"
+        best_move = result.get("best_move")
+        moves = result["moves"]
+        visits, values = result.get("visits", []), result.get("values", [])
+
+        return (RESULT_HEADER.pack(cancelled, -1 if best_move is None else best_move, result.get("score", 0),
+                                   result["hits"], result["misses"], result["nodes"], len(moves), len(visits))
+                + bytes(moves) + b"".join(COLUMN_STATS.pack(v, value) for v, value in zip(visits, values)))
+
+    @staticmethod
+    def decode_result(data):
+        cancelled, best_move, score, hits, misses, nodes, length, columns = RESULT_HEADER.unpack_from(data)
+        offset = RESULT_HEADER.size + length
+        moves = tuple(data[RESULT_HEADER.size:offset])
+
+        if cancelled:
+            return {"type": "cancelled", "moves": moves, "hits": hits, "misses": misses, "nodes": nodes}
 
-        for c in range(board.columns):
-            if board.board[board.rows - 1, c] == EMPTY:
-                moves += 1
+        result = {"type": "result", "best_move": None if best_move < 0 else best_move, "score": score,
+                  "moves": moves, "hits": hits, "misses": misses, "nodes": nodes}
 
-        return moves
+        if columns > 0:
+            stats = [COLUMN_STATS.unpack_from(data, offset + i * COLUMN_STATS.size) for i in range(columns)]
+            result["visits"] = [v for v, _ in stats]
+            result["values"] = [value for _, value in stats]
+
+        return result
 
     @staticmethod
-    def minimax(board, player, depth):
-        return board.minimax(player, depth)
+    def encode_root(board):
+        return board.serialize()
 
-    def minimax(self, player, depth):
-        if self.is_win(COMPUTER):
-            return None, 1
-        elif self.is_win(PERSON):
-            return None, -1
+    @staticmethod
+    def decode_root(data):
+        return Board().deserialize(bytes(data))
 
-        valid_moves = Board.valid_moves(self)
 
-        if len(valid_moves) == 0 or depth == 0:
-            # nothing left to play, nobody won
-            return None, 0
+# games each task plays from a leaf in leaf parallel mcts, they run as one numpy batch, so fewer
+# make the messages cost more than the playouts
+LEAF_PLAYOUTS = 64
 
-        # Max player - COMPUTER
-        if player == COMPUTER:
-            value = -1
+# depth of the search the master runs on every task position to guess what it costs, when earlier
+# searches left nothing to go by
+PROBE_DEPTH = 2
 
-            best_move = random.choice(valid_moves)
+# every worker keeps a table per engine for the whole game, the same positions come up in the
+# rounds of one turn and in the tasks of the next; 0 turns it off
+CACHE_SIZE = 1 << 18
+caches = {}
 
-            for move in valid_moves:
-                new_board = self.__copy__()
-                new_board.play(move, COMPUTER)
 
-                _, new_score = new_board.minimax(PERSON, depth - 1)
-                new_score /= len(valid_moves)
+def set_cache_size(size):
+    # on every worker: MPI ranks run the main block themselves, local pool processes get it as
+    # their initializer
+    global CACHE_SIZE
+    CACHE_SIZE = size
+    caches.clear()
 
-                if new_score > value:
-                    value = new_score
-                    best_move = move
 
-            return best_move, value
+def worker_cache(engine):
+    if CACHE_SIZE == 0:
+        return None
 
-        # Min player - PERSON
-        if player == PERSON:
-            value = 1
+    if engine not in caches:
+        caches[engine] = TranspositionTable(CACHE_SIZE)
 
-            best_move = random.choice(valid_moves)
+    return caches[engine]
 
-            for move in valid_moves:
-                new_board = self.__copy__()
-                new_board.play(move, PERSON)
 
-                _, new_score = new_board.minimax(COMPUTER, depth - 1)
-                new_score /= len(valid_moves)
+# the tree each worker searches in mcts tasks, kept from one turn to the next like the caches
+trees = {}
 
-                if new_score < value:
-                    value = new_score
-                    best_move = move
 
-            return best_move, value
+def worker_tree():
+    if "mcts" not in trees:
+        trees["mcts"] = MCTS()
 
-    @staticmethod
-    def serialize():
-        return
+    return trees["mcts"]
 
-    def deserialize(self, string):
-        return
+
+def run_mcts(task, board, player):
+    tree = worker_tree()
+    tree.random.seed(task["seed"])
+
+    # a worker can get two tasks of the same turn, the first one's playouts are already counted
+    before = [0] * board.columns, [0] * board.columns
+    if tree.root is not None and tree.board.masks == board.masks:
+        before = tree.statistics(board.columns)
+
+    nodes = tree.search(board, player, task["iterations"] or None, task["time_limit"])
+    visits, values = tree.statistics(board.columns)
+
+    return {"type": "result", "best_move": None, "score": 0, "moves": task["moves"], "nodes": nodes,
+            "visits": [v - b for v, b in zip(visits, before[0])],
+            "values": [v - b for v, b in zip(values, before[1])]}
+
+
+def run_playouts(task, board, player):
+    # one batch on numpy arrays, a leaf takes a few milliseconds so it is not worth stopping
+    outcomes = playouts(board, player, task["iterations"], task["seed"])
+
+    return {"type": "result", "best_move": None, "score": int(outcomes.sum()), "moves": task["moves"],
+            "nodes": task["iterations"]}
+
+
+def run_task(task, root):
+    # the master only sends positions that still need a search, so every prefix move is valid
+    board = root.__copy__()
+    player = COMPUTER
+
+    for move in task["moves"]:
+        board.play(move, player)
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    # set by the transport once the master no longer needs this task
+    board.stop = task.get("stop")
+
+    if task["engine"] in ("mcts", "playouts"):
+        run = run_mcts if task["engine"] == "mcts" else run_playouts
+        try:
+            result = run(task, board, player)
+        except SearchTimeout:
+            result = {"type": "cancelled", "moves": task["moves"], "nodes": 0}
+
+        result["hits"], result["misses"] = 0, 0
+        return result
+
+    if task["time_limit"] is not None:
+        board.deadline = time.time() + task["time_limit"]
+
+    table = worker_cache(task["engine"])
+    hits, misses = (table.hits, table.misses) if table is not None else (0, 0)
+
+    try:
+        if task["engine"] == "alphabeta":
+            move, score, _ = board.alphabeta(player, task["depth"], table)
+        elif task["engine"] == "solve":
+            move, score = board.solve(player, table)
+        else:
+            move, score = board.minimax(depth=task["depth"], player=player, table=table)
+        result = {"type": "result", "best_move": move, "score": score, "moves": task["moves"]}
+    except SearchTimeout:
+        result = {"type": "cancelled", "moves": task["moves"]}
+
+    # what this task got out of the cache, the master adds it up per turn, and what it cost
+    result["hits"], result["misses"] = (table.hits - hits, table.misses - misses) if table is not None else (0, 0)
+    result["nodes"] = board.nodes
+
+    return result
 
 
 class Connect4MPI:
-    def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT, depth=2):
+    def __init__(self, width=BOARD_WIDTH, height=BOARD_HEIGHT, depth=2, engine="minimax", time_limit=None,
+                 transport=None, prefix_depth=None, tasks_per_worker=8, ponder=False, book=None,
+                 telemetry_path=None, iterations=None, mcts_mode="root", solve_below=None, tablebase=None):
+        if engine not in ("minimax", "alphabeta", "mcts"):
+            raise Exception("Unknown engine " + engine)
+        if mcts_mode not in ("root", "leaf"):
+            raise Exception("Unknown mcts mode " + mcts_mode)
+
         self.board = None
         self.width, self.height, self.depth = width, height, depth
-        self.comm = MPI.COMM_WORLD
-        self.size = self.comm.Get_size()
-        self.rank = self.comm.Get_rank()
+        self.engine = engine
+
+        # with a time limit (in seconds) the workers search one ply deeper each round until it runs out;
+        # depth_reached is how deep the last such search got
+        self.time_limit = time_limit
+        self.depth_reached = None
+
+        # MPI by default, LocalTransport runs the same tasks on a process pool
+        self.transport = transport if transport is not None else MPITransport(codec=BinaryCodec())
+        self.size = self.transport.size
+        self.rank = self.transport.rank
+
+        # plies played out on the master before handing positions to workers, at least the two
+        # that aggregate_results works with; None picks enough to keep every worker busy
+        self.prefix_depth = prefix_depth
+        self.tasks_per_worker = tasks_per_worker
 
         self.num_tasks = self.width * self.width
         self.tasks = []
         self.results = {}
 
+        # prefixes deeper than two plies that were split further, with the player to move and their children
+        self.children = {}
+
+        # on a root that is its own mirror image, the first two moves that score the same as their
+        # mirror image, which is searched instead
+        self.mirrored = {}
+
+        # worker cache hits and misses of the current turn
+        self.cache_stats = {"hits": 0, "misses": 0}
+
+        # nodes the search of each task position took, by its hash, in this turn and the one before;
+        # the next tasks are handed out the most expensive first
+        self.costs = {}
+        self.last_costs = {}
+
+        # the workers search the replies to the person's moves while they type theirs, keyed by their move
+        self.ponder = ponder
+        self.pondered = {}
+
+        # path of an opening book made by book.py, positions in it are not searched
+        self.book = OpeningBook(book) if book is not None and self.rank == 0 else None
+
+        # the transport keeps per turn and per rank counters, summed up when the game ends
+        self.telemetry_path = telemetry_path
+
+        # mcts in root mode has every worker grow its own tree from the root and adds up their
+        # visits, in leaf mode the master keeps the tree and the workers play out its leaves;
+        # iterations are playouts over all workers with root parallel mcts and the leaves the tree
+        # grows by with leaf parallel
+        self.iterations = iterations
+        if engine == "mcts" and iterations is None and time_limit is None:
+            self.iterations = MCTS_ITERATIONS
+        self.mcts_mode = mcts_mode
+        self.tree = MCTS() if engine == "mcts" and mcts_mode == "leaf" else None
+
+        # forked pool processes start with the same random state, so the master seeds their playouts
+        self.random = random.Random()
+
+        # with at most solve_below empty cells the workers solve the task positions exactly and the
+        # person is taken to answer with their best reply; exact is set for the turns that do, which
+        # ignore the time limit. Solved roots are kept in the tablebase at that path
+        self.solve_below = solve_below
+        self.exact = False
+        self.tablebase = Tablebase(tablebase, width, height) if tablebase is not None and self.rank == 0 else None
+
     def run(self):
         if self.rank == 0:
             self.do_master()
         else:
             self.do_worker()
 
-    def get_tasks(self):
+    def get_prefix_depth(self, depth):
+        if self.prefix_depth is not None:
+            prefix_depth = self.prefix_depth
+        else:
+            prefix_depth = 2
+            while self.width ** prefix_depth < self.tasks_per_worker * self.transport.workers:
+                prefix_depth += 1
+
+        # every ply on the master is one ply less for the workers
+        return max(2, min(prefix_depth, depth + 2))
+
+    def get_tasks(self, depth, first_move=None):
+        # plays out every prefix on the master, the results of everything decided on the way (invalid
+        # moves, wins, the search horizon) are filled in right away and the rest become tasks; on a
+        # symmetric root only the first two moves up to their mirror image are played out
+        prefix_depth = self.get_prefix_depth(depth)
+        board = self.board.__copy__()
+
         tasks = []
         results = {}
+        self.children = {}
+        self.mirrored = {}
 
         for i in range(self.width):
             for j in range(self.width):
                 move = (i, j)
 
-                task = {"computer_move": i, "person_move": j, "type": "minimax", "board": self.board.__copy__()}
+                mirror = (self.width - 1 - i, self.width - 1 - j)
+                if board.is_symmetric() and mirror < move:
+                    self.mirrored[move] = mirror
+                    continue
 
-                tasks.append(task)
-                results[move] = -1
+                if i not in Board.valid_moves(board):
+                    results[move] = -1
+                    continue
 
-        return tasks, {}
+                board.play(i, COMPUTER)
 
-    def do_master(self):
-        self.board = Board(width=self.width, height=self.height)
+                if j not in Board.valid_moves(board):
+                    results[move] = -1
+                elif board.last_move_wins():
+                    # the person's reply cannot undo a win that is already on the board
+                    results[move] = self.win_score(board) if self.exact else 1
+                else:
+                    board.play(j, PERSON)
+                    self.split(board, move, COMPUTER, depth, prefix_depth, tasks, results)
+                    board.undo(j)
 
-        self.play()
+                board.undo(i)
 
-        self.notify_workers({"type": "end"})
+        self.schedule(tasks)
 
-        return
+        if first_move is not None:
+            # tasks are popped from the end, so the previous best column goes out first
+            tasks.sort(key=lambda task: task["moves"][0] == first_move)
 
-    def notify_workers(self, msg):
-        for i in range(1, self.size):
-            self.comm.send(msg, dest=i, tag=0)
+        return tasks, results
 
-    def do_worker(self):
-        while True:
-            request = {"type": "request", "rank": self.rank}
+    def cost(self, task):
+        # the nodes the same position took in an earlier round, or the position two plies up in the
+        # previous turn, which the task position is part of
+        for key in task["affinity"]:
+            nodes = self.costs.get(key, self.last_costs.get(key))
+            if nodes is not None:
+                return nodes
 
-            self.comm.send(request, dest=0, tag=0)
+        return None
 
-            task = self.comm.recv(source=0, tag=0)
+    def probe(self, task):
+        # the nodes of a PROBE_DEPTH search of the task position on the master
+        board = self.board.__copy__()
+        player = COMPUTER
 
-            if task["type"] == "end":
-                break
-            elif task["type"] == "minimax":
-                board = task["board"]
+        for move in task["moves"]:
+            board.play(move, player)
+            player = PERSON if player == COMPUTER else COMPUTER
 
-                move_computer = task["computer_move"]
-                move_person = task["person_move"]
+        if self.engine == "alphabeta":
+            board.alphabeta(player, PROBE_DEPTH)
+        else:
+            board.minimax(depth=PROBE_DEPTH, player=player)
 
-                valid = True
+        return board.nodes
 
-                if move_computer in Board.valid_moves(board):
-                    board.play(move_computer, COMPUTER)
-                else:
-                    valid = False
+    def schedule(self, tasks):
+        # largest first, so an expensive task cannot start last and hold up the round; tasks go out
+        # from the end, and the ones without an estimate count as the average
+        costs = [self.cost(task) for task in tasks]
+        known = [nodes for nodes in costs if nodes is not None]
 
-                if move_person in Board.valid_moves(board) and valid:
-                    board.play(move_person, PERSON)
-                else:
-                    valid = False
+        if len(known) == 0 and len(tasks) > 0 and tasks[0]["depth"] >= PROBE_DEPTH + 3:
+            # nothing to go by, but the tasks are deep enough that a shallow search of each costs
+            # next to nothing against them
+            costs = [self.probe(task) for task in tasks]
+            known = costs
 
-                if valid:
-                    move, score = board.minimax(depth=self.depth, player=COMPUTER)
+        if len(known) == 0:
+            return
 
-                    result = {"type": "result", "best_move": move, "score": score,
-                              "computer_move": task["computer_move"],
-                              "person_move": task["person_move"]}
-                else:
-                    result = {"type": "result", "best_move": None, "score": -1,
-                              "computer_move": task["computer_move"],
-                              "person_move": task["person_move"]}
+        average = sum(known) / len(known)
+        order = sorted(range(len(tasks)), key=lambda i: costs[i] if costs[i] is not None else average)
+
+        tasks[:] = [tasks[i] for i in order]
+
+    def win_score(self, board):
+        # what Board.alphabeta gives the last move if it won, sooner is better
+        cells = board.columns * board.rows
+        return (cells - sum(board.heights) + 1) / cells
+
+    def split(self, board, moves, player, depth, prefix_depth, tasks, results):
+        # mirrors the checks at the top of Board.minimax and Board.negamax
+        if board.last_move_wins():
+            score = 1
+            if self.engine == "alphabeta" or self.exact:
+                score = self.win_score(board)
+
+            results[moves] = score if board.last_player() == COMPUTER else -score
+            return
+
+        valid_moves = Board.valid_moves(board)
+
+        if len(valid_moves) == 0 or depth == 0:
+            results[moves] = 0
+        elif len(moves) >= prefix_depth:
+            tasks.append({"moves": moves, "type": "minimax", "engine": "solve" if self.exact else self.engine,
+                          "depth": depth, "time_limit": None, "affinity": self.affinity(board, moves)})
+        else:
+            opponent = PERSON if player == COMPUTER else COMPUTER
+            self.children[moves] = (player, [moves + (move,) for move in valid_moves])
+
+            for move in valid_moves:
+                board.play(move, player)
+                self.split(board, moves + (move,), opponent, depth - 1, prefix_depth, tasks, results)
+                board.undo(move)
+
+    def affinity(self, board, moves):
+        # the task position itself, which the previous rounds of this turn searched, and the one two
+        # plies up, which is where the tasks of the previous turn were; a position and its mirror
+        # image share the worker caches, so they share a key here too
+        keys = [min(board.hash, board.mirror_hash)]
+
+        if len(moves) > 2:
+            key, mirror_key = board.hash, board.mirror_hash
+            heights = list(board.heights)
+
+            for i in range(len(moves) - 1, len(moves) - 3, -1):
+                column = moves[i]
+                heights[column] -= 1
+                player = COMPUTER if i % 2 == 0 else PERSON
+                key ^= board.zobrist[player][column * board.stride + heights[column]]
+                mirror_key ^= board.zobrist[player][(board.columns - 1 - column) * board.stride + heights[column]]
+
+            keys.append(min(key, mirror_key))
+
+        return tuple(keys)
+
+    def fold(self, moves, results, missing=-1):
+        # tasks that are not back count as missing: -1 gives the least a prefix is sure to score,
+        # 1 the most it can still score
+        if moves in self.mirrored:
+            return self.fold(self.mirrored[moves], results, missing)
+
+        if moves not in self.children:
+            return results.get(moves, missing)
+
+        player, children = self.children[moves]
+        scores = [self.fold(child, results, missing) for child in children]
+
+        if self.engine == "alphabeta" or self.exact:
+            return max(scores) if player == COMPUTER else min(scores)
+
+        # same as Board.minimax: children are averaged in and the bound starts at a loss
+        if player == COMPUTER:
+            return max([-1] + [score / len(scores) for score in scores])
+
+        return min([1] + [score / len(scores) for score in scores])
+
+    def fold_results(self, results):
+        folded = {}
+
+        for i in range(self.width):
+            for j in range(self.width):
+                folded[(i, j)] = self.fold((i, j), results)
+
+        return folded
+
+    def do_master(self):
+        self.board = Board(width=self.width, height=self.height)
+
+        self.play()
+
+        write(self.transport.telemetry.summary())
+        if self.telemetry_path is not None:
+            self.transport.telemetry.dump(self.telemetry_path)
+
+        self.transport.close()
 
-                self.comm.send(result, dest=0, tag=0)
         return
 
+    def do_worker(self):
+        self.transport.serve(run_task)
+
+    def best_reply(self, column, score):
+        # exact turns: the person answers column with the reply that is worst for the computer, score
+        # gives what each of the first two moves is worth
+        heights = list(self.board.heights)
+        heights[column] += 1
+        replies = [j for j in range(self.width) if heights[j] < self.height]
+
+        if len(replies) == 0:
+            # column filled the board, a draw unless it won
+            board = self.board.__copy__()
+            board.play(column, COMPUTER)
+            return self.win_score(board) if board.last_move_wins() else 0
+
+        return min(score((column, j)) for j in replies)
+
+    def column_bounds(self, column, results):
+        # the same average as aggregate_results, with the missing tasks at their worst and best
+        if self.exact:
+            return (self.best_reply(column, lambda moves: self.fold(moves, results, -1)),
+                    self.best_reply(column, lambda moves: self.fold(moves, results, 1)))
+
+        lows = [self.fold((column, j), results, -1) for j in range(self.width)]
+        highs = [self.fold((column, j), results, 1) for j in range(self.width)]
+
+        return sum(lows) / self.width, sum(highs) / self.width
+
+    def beaten(self, bounds):
+        # columns play can no longer pick: another one is sure to score more, or as much and comes
+        # first, which is how max breaks the tie
+        columns = list(bounds)
+        out = set()
+
+        for i, column in enumerate(columns):
+            for j, other in enumerate(columns):
+                if bounds[other][0] > bounds[column][1] or (j < i and bounds[other][0] == bounds[column][1]):
+                    out.add(column)
+                    break
+
+        return out
+
+    def farm(self, tasks, results, deadline=None, stop=None):
+        # returns False if the deadline or the stop event cut the round short; the tasks of a column
+        # that cannot be picked any more are dropped, and once only one column is left the round
+        # ends there and the workers give up what they are still searching. fold_results then gives
+        # the columns that were cut what they were sure to score
+        expected = len(tasks)
+        received = 0
+
+        # the transport takes the affinity keys out, the first one is the task position
+        keys = {task["moves"]: task["affinity"][0] for task in tasks}
+
+        bounds = {c: self.column_bounds(c, results) for c in Board.valid_moves(self.board)}
+        out = self.beaten(bounds)
+
+        if len(out) < len(bounds) - 1:
+            for msg in self.transport.farm(tasks, run_task, deadline):
+                self.cache_stats["hits"] += msg["hits"]
+                self.cache_stats["misses"] += msg["misses"]
+
+                if msg["type"] == "result":
+                    #write(msg)
+                    results[msg["moves"]] = msg["score"]
+                    received += 1
+
+                    self.costs[keys[msg["moves"]]] = msg["nodes"]
+
+                    # on a symmetric root the result also stands for its mirror image in the
+                    # mirrored column
+                    column = msg["moves"][0]
+                    for c in {column, self.width - 1 - column} if self.mirrored else {column}:
+                        if c in bounds:
+                            bounds[c] = self.column_bounds(c, results)
+
+                    for column in self.beaten(bounds) - out:
+                        out.add(column)
+
+                        left = [task for task in tasks if task["moves"][0] != column]
+                        expected -= len(tasks) - len(left)
+                        tasks[:] = left
+
+                if (stop is not None and stop.is_set()) or (len(out) == len(bounds) - 1 and received < expected):
+                    break
+
+        return len(out) == len(bounds) - 1 or received == expected
+
     def aggregate_results(self, results, board):
+        if self.exact:
+            return {c: self.best_reply(c, results.get) for c in Board.valid_moves(board)}
+
         aggregated = {}
 
         valid_moves = Board.valid_moves(board)
@@ -282,29 +652,236 @@ class Connect4MPI:
 
         return aggregated
 
+    def mcts_task(self, engine, moves, iterations):
+        return {"moves": moves, "type": "minimax", "engine": engine, "depth": 0, "time_limit": None,
+                "iterations": iterations, "seed": self.random.getrandbits(32)}
+
+    def root_parallel(self, stop=None):
+        # one tree per worker, all from the root with their own seeds; the share of the summed
+        # visits is what a column scores. The playouts go out in tasks_per_worker chunks per
+        # worker, a worker carries on with its tree when it gets another chunk, so the ones that
+        # run faster simply get more; with a time limit every worker gets one task for all of it
+        workers = self.transport.workers
+        deadline = None
+
+        if self.time_limit is not None:
+            deadline = time.time() + self.time_limit
+            tasks = [self.mcts_task("mcts", (), 0) for _ in range(workers)]
+        else:
+            chunks = workers * self.tasks_per_worker
+            tasks = [self.mcts_task("mcts", (), -(-self.iterations // chunks)) for _ in range(chunks)]
+
+        visits = [0] * self.width
+        for msg in self.transport.farm(tasks, run_task, deadline):
+            if msg["type"] == "result":
+                visits = [a + b for a, b in zip(visits, msg["visits"])]
+
+            if stop is not None and stop.is_set():
+                return None
+
+        return visits
+
+    def leaf_parallel(self, stop=None):
+        # the master walks its tree down to two new leaves per worker and every leaf goes out as a
+        # task of LEAF_PLAYOUTS games; until they are back the leaves carry a virtual loss, which
+        # keeps the walks of one round apart. Iterations are the leaves the tree grows by, the tree
+        # below the moves played since the last turn is kept
+        self.tree.start(self.board, COMPUTER)
+        deadline = time.time() + self.time_limit if self.time_limit is not None else None
+        count = 0
+
+        while self.iterations is None or count < self.iterations:
+            if deadline is not None and count > 0 and time.time() > deadline:
+                break
+            if stop is not None and stop.is_set():
+                return None
+
+            leaves = {}
+            tasks = []
+
+            for _ in range(2 * self.transport.workers):
+                if self.iterations is not None and count + len(leaves) >= self.iterations:
+                    break
+
+                board = self.board.__copy__()
+                node = self.tree.descend(board)
+
+                if node.result is not None:
+                    # the game is over there, it scores the same every time
+                    self.tree.backpropagate(node, node.result * LEAF_PLAYOUTS, LEAF_PLAYOUTS)
+                    count += 1
+                    continue
+
+                moves = tuple(board.moves[len(self.board.moves):])
+                leaves[moves] = node
+                self.tree.virtual_loss(node, LEAF_PLAYOUTS)
+                tasks.append(self.mcts_task("playouts", moves, LEAF_PLAYOUTS))
+
+            # the first round always finishes, so the root has a move to pick
+            for msg in self.transport.farm(tasks, run_task, deadline if count > 0 else None):
+                if msg["type"] == "result":
+                    node = leaves.pop(msg["moves"])
+                    self.tree.virtual_loss(node, -LEAF_PLAYOUTS)
+                    self.tree.backpropagate(node, msg["score"], msg["nodes"])
+                    count += 1
+
+                if stop is not None and stop.is_set():
+                    break
+
+            # leaves cut off by the deadline or the stop event; a walk can expand below a leaf of the
+            # same round, so the later leaves go first and one that got visits below it stays
+            for node in leaves.values():
+                self.tree.virtual_loss(node, -LEAF_PLAYOUTS)
+            for node in reversed(list(leaves.values())):
+                if node.visits == 0:
+                    self.tree.discard(node)
+
+        if stop is not None and stop.is_set():
+            return None
+
+        visits, _ = self.tree.statistics(self.width)
+
+        return visits
+
+    def solve(self, stop=None):
+        empty = self.width * self.height - sum(self.board.heights)
+        tasks, results = self.get_tasks(empty)
+
+        if not self.farm(tasks, results, stop=stop):
+            return None
+
+        aggregated = self.aggregate_results(self.fold_results(results), self.board)
+
+        # a column that won before all of its tasks were back is only sure to score at least
+        # what it got, the tablebase only takes exact scores
+        best_move = max(aggregated, key=aggregated.get)
+        low, high = self.column_bounds(best_move, results)
+
+        if self.tablebase is not None and low == high:
+            self.tablebase.put(self.board, COMPUTER, best_move, low)
+            self.tablebase.save()
+
+        return aggregated
+
+    def search(self, stop=None):
+        empty = self.width * self.height - sum(self.board.heights)
+        self.exact = self.solve_below is not None and empty <= self.solve_below
+
+        if self.exact and self.tablebase is not None:
+            entry = self.tablebase.get(self.board, COMPUTER)
+            if entry is not None:
+                self.cache_stats = {"hits": 0, "misses": 0}
+                return {entry[0]: entry[1]}
+
+        # workers get the position once per turn, tasks only carry the moves from it
+        self.transport.broadcast(self.board)
+        self.cache_stats = {"hits": 0, "misses": 0}
+
+        if self.exact:
+            return self.solve(stop)
+
+        if self.engine == "mcts":
+            visits = self.root_parallel(stop) if self.mcts_mode == "root" else self.leaf_parallel(stop)
+            if visits is None:
+                return None
+
+            total = max(1, sum(visits))
+            return {c: visits[c] / total for c in Board.valid_moves(self.board)}
+
+        # None if stop was set before the search finished
+        if self.time_limit is None:
+            tasks, results = self.get_tasks(self.depth)
+            if not self.farm(tasks, results, stop=stop):
+                return None
+
+            return self.aggregate_results(self.fold_results(results), self.board)
+
+        deadline = time.time() + self.time_limit
+
+        # fallback in case not even the first round finishes in time
+        aggregated = {c: 0 for c in self.board.order if c in Board.valid_moves(self.board)}
+        best_move = None
+        depth = 0
+
+        while depth < self.width * self.height - sum(self.board.heights):
+            tasks, results = self.get_tasks(depth + 1, best_move)
+            if not self.farm(tasks, results, deadline, stop):
+                break
+
+            aggregated = self.aggregate_results(self.fold_results(results), self.board)
+            best_move = max(aggregated, key=aggregated.get)
+            depth += 1
+
+        self.depth_reached = depth
+
+        if stop is not None and stop.is_set():
+            return None
+
+        return aggregated
+
+    def book_move(self):
+        if self.book is None:
+            return None
+
+        return self.book.get(self.board)
+
+    def ponder_moves(self):
+        # most likely moves first, a reply only counts if its search finished before the person's
+        # move came in, so it is what search would have returned
+        line, typed = read_in_background()
+        self.pondered = {}
+        self.transport.telemetry.start_turn("ponder")
+
+        for move in [c for c in self.board.order if c in Board.valid_moves(self.board)]:
+            self.board.play(move, PERSON)
+
+            if (not self.board.last_move_wins() and len(Board.valid_moves(self.board)) > 0
+                    and self.book_move() is None):
+                aggregated = self.search(typed)
+                if aggregated is not None:
+                    self.pondered[move] = aggregated
+
+            self.board.undo(move)
+
+            if typed.is_set():
+                break
+
+        self.transport.telemetry.end_turn()
+
+        typed.wait()
+        if len(line) == 0:
+            raise EOFError()
+
+        return int(line[0])
+
     def play(self):
         win = False
+        move = None
         write(self.board.__str__())
 
         while not win:
             write("COMPUTER PLAYING")
 
             start_time = time.time()
-            tasks, results = self.get_tasks()
-
-            while len(tasks) > 0:
-                msg = self.comm.recv()
-
-                if msg["type"] == "request":
-                    task = tasks.pop()
-                    self.comm.send(task, dest=msg["rank"])
-                elif msg["type"] == "result":
-                    #write(msg)
-                    move = (msg["computer_move"], msg["person_move"])
-
-                    results[move] = msg["score"]
-
-            aggregated = self.aggregate_results(results, self.board)
+            self.transport.telemetry.start_turn()
+            self.last_costs, self.costs = self.costs, {}
+            book_move = self.book_move()
+
+            if book_move is not None:
+                # the book only keeps the move it picked
+                write("Book move")
+                aggregated = {book_move[0]: book_move[1]}
+                self.cache_stats = {"hits": 0, "misses": 0}
+            else:
+                aggregated = self.pondered.get(move)
+                if aggregated is None:
+                    self.depth_reached = None
+                    aggregated = self.search()
+                    if self.depth_reached is not None:
+                        write("Depth reached: " + str(self.depth_reached))
+            self.pondered = {}
+            self.transport.telemetry.end_turn()
+            turn = self.transport.telemetry.turns[-1]
 
             write(str(aggregated))
             best_move = max(aggregated, key=aggregated.get)
@@ -312,16 +889,18 @@ class Connect4MPI:
 
             end_time = time.time()
             write("Time taken: " + str(end_time - start_time))
-            
+            write("Worker caches: " + str(self.cache_stats))
+            write("Makespan: %.3f s, an ideal schedule %.3f s" % (turn["makespan"], turn["ideal"]))
+
             self.board.play(best_move, COMPUTER)
 
             write(self.board.__str__())
-            if self.board.is_win(COMPUTER):
+            if self.board.last_move_wins():
                 write("Computer won")
                 break
 
             write("YOU PLAY")
-            move = int(input())
+            move = self.ponder_moves() if self.ponder else int(input())
 
             while move not in Board.valid_moves(self.board):
                 write("Invalid move")
@@ -330,11 +909,46 @@ class Connect4MPI:
             self.board.play(move, PERSON)
 
             write(self.board.__str__())
-            if self.board.is_win(PERSON):
+            if self.board.last_move_wins():
                 write("You won")
                 break
 
 
-connect4 = Connect4MPI(depth=4)
-
-connect4.run()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", type=int, metavar="PROCESSES",
+                        help="search on a local process pool instead of MPI ranks")
+    parser.add_argument("--prefix-depth", type=int,
+                        help="plies to split on the master (default: based on the number of workers)")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE,
+                        help="entries in each worker's search cache, 0 turns it off")
+    parser.add_argument("--ponder", action="store_true",
+                        help="search the replies to every move while the person is typing")
+    parser.add_argument("--book", help="opening book made by book.py")
+    parser.add_argument("--telemetry", metavar="PATH", help="also write the per turn and per rank telemetry as JSON")
+    parser.add_argument("--engine", choices=["minimax", "alphabeta", "mcts"], default="minimax")
+    parser.add_argument("--depth", type=int, default=4, help="search depth of minimax and alphabeta")
+    parser.add_argument("--time-limit", type=float,
+                        help="seconds per move, minimax and alphabeta go one ply deeper each round until they are up")
+    parser.add_argument("--iterations", type=int,
+                        help="playouts per move over all workers with root parallel mcts, leaves with leaf parallel")
+    parser.add_argument("--mcts", choices=["root", "leaf"], default="root",
+                        help="a tree per worker, or one tree on the master with the workers playing out its leaves")
+    parser.add_argument("--solve-below", type=int, metavar="CELLS",
+                        help="solve positions with at most this many empty cells exactly")
+    parser.add_argument("--tablebase", metavar="PATH", help="file the solved positions are kept in between games")
+    args = parser.parse_args()
+
+    set_cache_size(args.cache_size)
+
+    transport = None
+    if args.local:
+        transport = LocalTransport(args.local, codec=BinaryCodec(), initializer=set_cache_size,
+                                   initargs=(args.cache_size,))
+
+    connect4 = Connect4MPI(depth=args.depth, time_limit=args.time_limit, engine=args.engine, transport=transport,
+                           prefix_depth=args.prefix_depth, ponder=args.ponder, book=args.book,
+                           telemetry_path=args.telemetry, iterations=args.iterations, mcts_mode=args.mcts,
+                           solve_below=args.solve_below, tablebase=args.tablebase)
+
+    connect4.run()
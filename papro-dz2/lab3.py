@@ -1,137 +1,142 @@
-from mpi4py import MPI
+import argparse
+from collections import OrderedDict
+
 import numpy as np
 from copy import deepcopy
 
+from connect4 import read_in_background
+from transport import LocalTransport, MPITransport
+
 H = 6
 W = 7
 winLen = 4
-playPiece = "P"
-compPiece = "C"
-emptPiece = "."
+# the field holds these as int8, pieceNames turns it back into the letters it is printed with
+emptPiece, compPiece, playPiece = 0, 1, 2
+pieceNames = np.array([".", "C", "P"])
 maxDepth = 5
+tasksPerWorker = 8
 
 
-class Board:
-    def __init__(self, isComputerFirst):
-        listaH = []
-        for i in range(H):
-            listaW = []
-            for j in range(W):
-                listaW.append(emptPiece)
-            listaH.append(listaW)
+class Cache:
+    # dfs results by field, piece to move and column, kept for the whole game
+    def __init__(self, maxSize=1 << 16):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-        self.field = np.array(listaH)
+    def get(self, key, remaining):
+        entry = self.entries.get(key)
 
-        if isComputerFirst:
-            self.nextPiece = compPiece
-        else:
-            self.nextPiece = playPiece
+        # a forced win or loss stays one when searched deeper, so it is good for any depth past its own
+        if entry is not None and (entry[0] == remaining or (entry[0] < remaining and entry[1] in (-1, 1))):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
 
-    def findFirst(self, col):
-        for i in range(0, H):
-            if self.field[i][col] != emptPiece:
-                return i, True
+        self.misses += 1
+        return False, None
 
-        return H, False
+    def put(self, key, remaining, score):
+        if self.maxSize == 0:
+            return
 
-    def checkVertical(self, row, col):
-        leng = 0
-        for i in range(winLen):
-            if row + i >= H:
-                return False
+        self.entries[key] = (remaining, score)
+        self.entries.move_to_end(key)
 
-            if self.field[row][col] != self.field[row + i][col]:
-                return False
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
 
-            leng += 1
-            if leng >= winLen:
-                return True
 
-    def checkHorizontal(self, row, col):
-        lenL = 0
-        lenR = 0
-        for i in range(1, winLen):
-            if col - i < 0:
-                break
+cache = Cache()
 
-            if self.field[row][col] != self.field[row][col - i]:
-                break
 
-            lenL += 1
+class WinningLines:
+    # every run of length cells in a row, column or diagonal of an h x w field, as flat cell
+    # indices row * w + col, and for every cell the lines through it
+    def __init__(self, h, w, length):
+        self.lines = []
 
-        for i in range(1, winLen):
-            if col + i >= W:
-                break
+        for row in range(h):
+            for col in range(w):
+                for dRow, dCol in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    endRow, endCol = row + (length - 1) * dRow, col + (length - 1) * dCol
+                    if endRow < h and 0 <= endCol < w:
+                        self.lines.append(tuple((row + i * dRow) * w + col + i * dCol for i in range(length)))
 
-            if self.field[row][col] != self.field[row][col + i]:
-                break
+        cellLines = [[] for _ in range(h * w)]
+        for i, line in enumerate(self.lines):
+            for cell in line:
+                cellLines[cell].append(i)
 
-            lenR += 1
+        self.cellLines = [tuple(lines) for lines in cellLines]
 
-        if lenL + lenR + 1 >= winLen:
-            return True
 
-        return False
+# built once per field size and line length, boards share them
+lineTables = {}
 
-    def checkFirstDiagonal(self, row, col):  # /
-        lenL = 0
-        lenR = 0
-        for i in range(1, winLen):
-            if col - i < 0 or row + i >= H:
-                break
 
-            if self.field[row][col] != self.field[row + i][col - i]:
-                break
+def winningLines(h, w, length):
+    if (h, w, length) not in lineTables:
+        lineTables[(h, w, length)] = WinningLines(h, w, length)
 
-            lenL += 1
+    return lineTables[(h, w, length)]
 
-        for i in range(1, winLen):
-            if col + i >= W or row - i < 0:
-                break
 
-            if self.field[row][col] != self.field[row - i][col + i]:
-                break
+class SearchCancelled(Exception):
+    pass
 
-            lenR += 1
 
-        if lenL + lenR + 1 >= winLen:
-            return True
+class Board:
+    def __init__(self, isComputerFirst):
+        # row 0 is the top, a column fills from row H - 1 up; heights holds the pieces in each column
+        self.field = np.full((H, W), emptPiece, dtype=np.int8)
+        self.heights = [0] * W
 
-        return False
+        # pieces of each kind on every winning line, kept up to date by playTurn and revertTurn,
+        # so a win is one look at the lines through the cell that was played
+        self.winLen = winLen
+        self.lines = winningLines(H, W, winLen)
+        self.counts = {compPiece: [0] * len(self.lines.lines), playPiece: [0] * len(self.lines.lines)}
 
-    def checkSecondDiagonal(self, row, col):  # \
-        lenL = 0
-        lenR = 0
-        for i in range(1, winLen):
-            if col - i < 0 or row - i < 0:
-                break
+        if isComputerFirst:
+            self.nextPiece = compPiece
+        else:
+            self.nextPiece = playPiece
 
-            if self.field[row][col] != self.field[row - i][col - i]:
-                break
+        # a worker sets stop to the transport's flag for its task, dfs gives up once it is set;
+        # asking costs a message probe, so only every 256 calls
+        self.stop = None
+        self.calls = 0
 
-            lenL += 1
+    def __getstate__(self):
+        # the line tables are the same for every board of this size, so they are not copied
+        state = dict(self.__dict__)
+        del state["lines"]
 
-        for i in range(1, winLen):
-            if col + i >= W or row + i >= H:
-                break
+        return state
 
-            if self.field[row][col] != self.field[row + i][col + i]:
-                break
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lines = winningLines(*self.field.shape, self.winLen)
 
-            lenR += 1
+    def __str__(self):
+        return str(pieceNames[self.field])
 
-        if lenL + lenR + 1 >= winLen:
-            return True
+    def findFirst(self, col):
+        # the row of the top piece in col, H if it is empty
+        height = self.heights[col]
 
-        return False
+        return H - height, height > 0
 
     def isFinished(self, col):
-        row, _ = self.findFirst(col)
+        # the piece on top of col won if one of the lines through its cell is full of its kind
+        row = H - self.heights[col]
+        counts = self.counts[int(self.field[row, col])]
 
-        if self.checkVertical(row, col) or self.checkHorizontal(row, col) or self.checkFirstDiagonal(row,
-                                                                                                     col) or self.checkSecondDiagonal(
-                row, col):
-            return True
+        for line in self.lines.cellLines[row * W + col]:
+            if counts[line] >= self.winLen:
+                return True
 
         return False
 
@@ -139,8 +144,7 @@ class Board:
         if not self.isFinished(col):
             return 0
 
-        row, _ = self.findFirst(col)
-        if self.field[row][col] == playPiece:
+        if self.field[H - self.heights[col], col] == playPiece:
             return -1
 
         return 1
@@ -152,20 +156,29 @@ class Board:
             self.nextPiece = playPiece
 
     def playTurn(self, col):
-        if self.field[0][col] != emptPiece:
+        if self.heights[col] >= H:
             return False, None
 
-        row, _ = self.findFirst(col)
-        row -= 1
+        self.heights[col] += 1
+        row = H - self.heights[col]
+
+        self.field[row, col] = self.nextPiece
+        counts = self.counts[self.nextPiece]
+        for line in self.lines.cellLines[row * W + col]:
+            counts[line] += 1
 
-        self.field[row][col] = self.nextPiece
         self.rotatePiece()
         return True, self.isFinished(col)
 
     def revertTurn(self, col):
-        row, _ = self.findFirst(col)
+        row = H - self.heights[col]
+
+        counts = self.counts[int(self.field[row, col])]
+        for line in self.lines.cellLines[row * W + col]:
+            counts[line] -= 1
 
-        self.field[row][col] = emptPiece
+        self.field[row, col] = emptPiece
+        self.heights[col] -= 1
         self.rotatePiece()
         return
 
@@ -182,10 +195,29 @@ class Board:
         return bestCol, maxScore
 
     def dfs(self, col, depth, maxDepth=maxDepth):
+        if self.stop is not None:
+            self.calls += 1
+            if self.calls % 256 == 0 and self.stop.is_set():
+                raise SearchCancelled()
+
+        if cache.maxSize == 0:
+            return self.searchMove(col, depth, maxDepth)
+
+        key = (self.field.tobytes(), self.nextPiece, col)
+        found, score = cache.get(key, maxDepth - depth)
+        if found:
+            return score
+
+        score = self.searchMove(col, depth, maxDepth)
+        cache.put(key, maxDepth - depth, score)
+
+        return score
+
+    def searchMove(self, col, depth, maxDepth=maxDepth):
         # simulate move
         ok, fin = self.playTurn(col)
         if not ok:
-            self.revertTurn(col)
+            # a full column was left untouched, there is nothing to revert
             return None
         if fin:
             score = self.calculateScore(col)
@@ -218,7 +250,7 @@ class Board:
 
     def isFull(self):
         for i in range(W):
-            if self.field[0][i] == emptPiece:
+            if self.heights[i] < H:
                 return False
 
         return True
@@ -232,38 +264,349 @@ def contains(list, element):
     return False
 
 
-def sequential(board):
-    # create WxW tasks
+def prefixDepth(workers):
+    # split deeper until every worker gets several tasks, dfs still needs one level per task
+    depth = 2
+    while W ** depth < tasksPerWorker * workers and depth < maxDepth + 1:
+        depth += 1
+
+    return depth
+
+
+def solveTask(task, root):
+    hits, misses = cache.hits, cache.misses
+
+    try:
+        result = {"type": "result", "moves": task["moves"], "score": solveMoves(task["moves"], root,
+                                                                                 task.get("stop"))}
+    except SearchCancelled:
+        result = {"type": "cancelled", "moves": task["moves"]}
+
+    # what this task got out of the cache, the master adds it up per turn
+    result["hits"], result["misses"] = cache.hits - hits, cache.misses - misses
+
+    return result
+
+
+def solveMoves(moves, root, stop=None):
+    global H, W
+
+    board = deepcopy(root)
+    board.stop = stop
+
+    # only rank 0 reads the field size, workers take it from the board they get
+    H, W = board.field.shape
+
+    for move in moves[:2]:
+        ok, fin = board.playTurn(move)
+        if not ok:
+            return None
+
+        if fin:
+            return board.calculateScore(move)
+
+    if len(moves) == 2:
+        column, score = board.gameSimulation()
+
+        return score
+
+    # the master already checked the moves in between, the last one is searched like in gameSimulation
+    for move in moves[2:-1]:
+        board.playTurn(move)
+
+    return board.dfs(moves[-1], len(moves) - 3)
+
+
+def affinity(keys):
+    # the task itself and the position two plies up, where the tasks of the previous turn were
+    if len(keys) > 2:
+        return keys[-1], keys[-3]
+
+    return keys[-1],
+
+
+def splitTasks(board, prefixLen, tasks, results, children):
+    # same checks as the first two moves in solveTask
+    for i in range(W):
+        for j in range(W):
+            moves = (i, j)
+            keys = ((board.field.tobytes(), i),)
+
+            ok, fin = board.playTurn(i)
+            if not ok:
+                results[moves] = None
+                continue
+
+            if fin:
+                results[moves] = board.calculateScore(i)
+                board.revertTurn(i)
+                continue
+
+            keys += ((board.field.tobytes(), j),)
+
+            ok, fin = board.playTurn(j)
+            if not ok:
+                results[moves] = None
+            elif fin:
+                results[moves] = board.calculateScore(j)
+            elif prefixLen == 2:
+                tasks.append({"type": "task", "moves": moves, "affinity": affinity(keys)})
+            else:
+                # the root of gameSimulation, the computer picks the best column
+                children[moves] = (compPiece, [moves + (col,) for col in range(W)])
+                for col in range(W):
+                    splitDfs(board, moves + (col,), col, 0, prefixLen, tasks, results, children, keys)
+
+            if ok:
+                board.revertTurn(j)
+            board.revertTurn(i)
+
+
+def splitDfs(board, moves, col, depth, prefixLen, tasks, results, children, keys):
+    # the same steps as dfs, down to prefixLen moves
+    keys += ((board.field.tobytes(), col),)
+
+    if len(moves) == prefixLen:
+        tasks.append({"type": "task", "moves": moves, "affinity": affinity(keys)})
+        return
+
+    # dfs looks at the piece that made the move once the move is reverted
+    piece = board.nextPiece
+
+    ok, fin = board.playTurn(col)
+    if not ok:
+        results[moves] = None
+        return
+
+    if fin or depth == maxDepth - 1:
+        results[moves] = board.calculateScore(col)
+    else:
+        children[moves] = (piece, [moves + (i,) for i in range(W)])
+        for i in range(W):
+            splitDfs(board, moves + (i,), i, depth + 1, prefixLen, tasks, results, children, keys)
+
+    board.revertTurn(col)
+
+
+def foldResults(moves, results, children):
+    if moves not in children:
+        return results[moves]
+
+    piece, childMoves = children[moves]
+
+    scores = []
+    for child in childMoves:
+        score = foldResults(child, results, children)
+        if score is not None:
+            scores.append(score)
+
+    if len(moves) == 2:
+        # gameSimulation starts below any real score
+        maxScore = -2
+        for score in scores:
+            if score > maxScore:
+                maxScore = score
+
+        return maxScore
+
+    if len(scores) == 0:
+        return None
+
+    if piece == playPiece and contains(scores, -1):
+        return -1
+
+    if piece == compPiece and contains(scores, 1):
+        return 1
+
+    return sum(scores) / len(scores)
+
+
+def provenResult(moves, results, children):
+    # foldResults while tasks are still out: (True, score) once the missing ones cannot change it
+    if moves not in children:
+        if moves in results:
+            return True, results[moves]
+
+        return False, None
+
+    piece, childMoves = children[moves]
+
+    scores = []
+    complete = True
+    for child in childMoves:
+        known, score = provenResult(child, results, children)
+        if not known:
+            complete = False
+        elif score is not None:
+            scores.append(score)
+
+    if complete:
+        return True, foldResults(moves, results, children)
+
+    # one answer that wins is enough for the player, one move that wins is enough for the computer
+    if piece == playPiece and contains(scores, -1):
+        return True, -1
+
+    if piece == compPiece and contains(scores, 1):
+        return True, 1
+
+    return False, None
+
+
+def settledColumns(proven):
+    # columns playGame can no longer pick, and the one it will pick if that is already certain;
+    # one losing answer makes a column -1, and a column sure to score 1 beats every column after
+    # it and every one before it that cannot get to 1 any more
+    out = set()
+    best = None
+
+    complete = [all(known for known, _ in proven[i]) for i in range(W)]
+    scores = [[score for known, score in proven[i] if known and score is not None] for i in range(W)]
+
+    for i in range(W):
+        if contains(scores[i], -1):
+            out.add(i)
+        elif best is None and complete[i] and len(scores[i]) > 0 and min(scores[i]) == 1:
+            best = i
+
+    if best is None:
+        return out, None
+
+    for i in range(W):
+        if i > best or (i < best and (min(scores[i] + [1]) < 1 or (complete[i] and len(scores[i]) == 0))):
+            out.add(i)
+
+    return out, best
+
+
+def solveInOrder(tasks, root, stop):
+    # no transport, so the tasks run here one after the other and can be stopped halfway
+    while len(tasks) > 0:
+        task = tasks.pop(0)
+        task["stop"] = stop
+
+        yield solveTask(task, root)
+
+
+def computeResults(board, transport=None, stats=None, stop=None):
+    workers = 1
+    if transport is not None:
+        workers = transport.workers
+
     tasks = []
+    results = dict()
+    children = dict()
+
+    splitTasks(deepcopy(board), prefixDepth(workers), tasks, results, children)
+    expected = len(tasks)
+
+    # results are folded in as they come, the tasks of a column that is already settled are
+    # dropped and once the best column is certain the rest is not waited for
+    proven = {i: [provenResult((i, j), results, children) for j in range(W)] for i in range(W)}
+    out, best = settledColumns(proven)
+    decided = best is not None and len(out) == W - 1
+
+    if decided or transport is None:
+        solved = solveInOrder([] if decided else tasks, board, stop)
+    else:
+        # workers get the field once per turn, tasks only carry the moves from it
+        transport.broadcast(board)
+        solved = transport.farm(tasks, solveTask)
+
+    for result in solved:
+        if stats is not None:
+            stats["hits"] += result["hits"]
+            stats["misses"] += result["misses"]
+
+        if result["type"] == "result":
+            results[result["moves"]] = result["score"]
+            expected -= 1
+
+            i = result["moves"][0]
+            proven[i] = [provenResult((i, j), results, children) for j in range(W)]
+
+            settled, best = settledColumns(proven)
+            for task in [task for task in tasks if task["moves"][0] in settled - out]:
+                tasks.remove(task)
+                expected -= 1
+
+            out = settled
+            decided = best is not None and len(out) == W - 1
+
+        if (decided and expected > 0) or (stop is not None and stop.is_set()):
+            break
+
+    # the workers give up what they are still searching
+    solved.close()
+
+    # None if stop was set before every task that matters came back
+    if expected > 0 and not decided:
+        return None
+
+    # fold deeper prefixes back into one score per (computer, player) move pair, answers that were
+    # no longer needed are left out
+    folded = dict()
     for i in range(W):
         for j in range(W):
-            tasks.append((i, j))
+            folded[(i, j)] = proven[i][j][1]
 
-    while True:
-        results = dict()
+    return folded
+
+
+def ponderMoves(board, transport, stats):
+    # search the answer to every player move while they type theirs, centre columns first;
+    # only searches that finished before the move came in are kept
+    line, typed = read_in_background()
+    pondered = dict()
 
-        copyBoard = deepcopy(board)
+    if transport is not None:
+        transport.telemetry.start_turn("ponder")
 
-        for task in tasks:
+    for col in sorted(range(W), key=lambda c: abs(2 * c - W + 1)):
+        child = deepcopy(board)
+        ok, fin = child.playTurn(col)
 
-            board = deepcopy(copyBoard)
+        if ok and not fin and not child.isFull():
+            results = computeResults(child, transport, stats, typed)
+            if results is not None:
+                pondered[col] = results
+
+        if typed.is_set():
+            break
 
-            for move in task:
-                ok, fin = board.playTurn(move)
-                if not ok:
-                    results[task] = None
-                    break
+    if transport is not None:
+        transport.telemetry.end_turn()
 
-                if fin:
-                    results[task] = board.calculateScore(move)
-                    comm.send(("result", rank, tasks, "success",), 0)
-                    break
+    typed.wait()
+    if len(line) == 0:
+        raise EOFError()
 
-            column, score = board.gameSimulation()
+    return int(line[0]), pondered
 
-            results[task] = score
 
-        board = deepcopy(copyBoard)
+def sequential(board, ponder=False):
+    playGame(board, ponder=ponder)
+
+
+def playGame(board, transport=None, ponder=False):
+    stats = {"hits": 0, "misses": 0}
+    pondered = dict()
+    col_player = None
+
+    while True:
+        if transport is not None:
+            transport.telemetry.start_turn()
+
+        results = pondered.get(col_player)
+        if results is None:
+            results = computeResults(board, transport, stats)
+
+        if transport is not None:
+            transport.telemetry.end_turn()
+
+        # includes what went into pondering since the last move
+        print("Cache:", stats)
+        stats = {"hits": 0, "misses": 0}
 
         results_root = []
         for i in range(W):
@@ -298,7 +641,7 @@ def sequential(board):
 
         # print("Dobrota: ", results_root)
         board.playTurn(bestCol)
-        print(board.field)
+        print(board)
 
         if board.isFinished(bestCol):
             print("Game over, computer wins")
@@ -313,20 +656,56 @@ def sequential(board):
             break
 
         print("Next player move:")
-        col_player = int(input())
+        if ponder:
+            col_player, pondered = ponderMoves(board, transport, stats)
+        else:
+            col_player = int(input())
         board.playTurn(col_player)
-        print(board.field)
+        print(board)
 
         if board.isFinished(col_player):
             print("Game over, player wins")
             break
 
 
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-size = comm.Get_size()
+def configure(h, w, length, cacheSize):
+    # the field size, line length and cache size of a game, on the master and, as the initializer
+    # of the local pool, in every pool process, since spawn starts them with the defaults
+    global H, W, winLen
+
+    H, W, winLen = h, w, length
+    cache.maxSize = cacheSize
+    cache.entries.clear()
+
+
+def main():
+    global H, W, winLen
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", type=int, metavar="PROCESSES",
+                        help="search on a local process pool instead of MPI ranks")
+    parser.add_argument("--cache-size", type=int, default=cache.maxSize,
+                        help="dfs results each worker keeps for the whole game, 0 turns it off")
+    parser.add_argument("--ponder", action="store_true",
+                        help="search the answers to every move while the player is typing")
+    parser.add_argument("--telemetry", metavar="PATH", help="also write the per turn and per rank telemetry as JSON")
+    parser.add_argument("--win-length", type=int, default=winLen, help="pieces in a row that win")
+    args = parser.parse_args()
+
+    cache.maxSize = args.cache_size
+    winLen = args.win_length
+
+    transport = None
+    if not args.local:
+        transport = MPITransport()
+
+        if transport.rank != 0:
+            transport.serve(solveTask)
+            return
+
+        if transport.size == 1:
+            transport = None
 
-if rank == 0:
     print("Enter field height:")
     H = int(input())
 
@@ -339,141 +718,26 @@ if rank == 0:
     board = Board(firstMove == "C")
 
     if firstMove == "P":
-        print(board.field)
+        print(board)
         print("Next player move:")
         col_player = int(input())
         board.playTurn(col_player)
-        print(board.field)
+        print(board)
 
-    if size == 1:
-        sequential(board)
-    else:
+    # the pool is started after the field size is known so its processes get it too
+    if args.local:
+        transport = LocalTransport(args.local, initializer=configure, initargs=(H, W, winLen, cache.maxSize))
 
-        # create WxW tasks
-        tasks = []
-        for i in range(W):
-            for j in range(W):
-                tasks.append((i, j))
-
-        readyWorkers = []
-
-        while True:
-            results = dict()
-            taskIndex = 0
-
-            for i in range(len(readyWorkers)):
-                comm.send(("task", tasks[taskIndex], board), readyWorkers[i])
-                taskIndex += 1
-
-            readyWorkers = []
-
-            while len(readyWorkers) < size - 1:
-                data = comm.recv(source=MPI.ANY_SOURCE)
-
-                if data[0] == "ready":
-                    if taskIndex == W * W:
-                        readyWorkers.append(data[1])
-                    else:
-                        comm.send(("task", tasks[taskIndex], board), data[1])
-                        taskIndex += 1
-
-                if data[0] == "result":
-                    if data[2] == "error":
-                        results[data[2]] = data[3]
-                    else:
-                        results[data[2]] = data[4]
-
-            # print(results)
-
-            results_root = []
-            for i in range(W):
-                results_i = []
-                for j in range(W):
-                    if results[(i, j)] is not None:
-                        results_i.append(results[(i, j)])
-
-                if contains(results_i, -1):
-                    results_root.append(-1)
-                elif len(results_i) == 0:
-                    results_root.append(None)
-                else:
-                    results_root.append(sum(results_i) / len(results_i))
-
-            # if end of the game
-            noneCnt = 0
-            for el in results_root:
-                if el is None:
-                    noneCnt += 1
-
-            if noneCnt == len(results_root):
-                print("Game over, no winner")
-                break
-
-            bestCol = -1
-            maxScore = -2
-            for i in range(W):
-                if results_root[i] is not None and results_root[i] > maxScore:
-                    maxScore = results_root[i]
-                    bestCol = i
-
-            # print("Dobrota: ", results_root)
-            board.playTurn(bestCol)
-            print(board.field)
-
-            if board.isFinished(bestCol):
-                print("Game over, computer wins")
-                break
-
-            if board.isFull():
-                print("Game over")
-                if maxScore == 1:
-                    print("Computer wins")
-                elif maxScore == -1:
-                    print("Player wins")
-                break
-
-            print("Next player move:")
-            col_player = int(input())
-            board.playTurn(col_player)
-            print(board.field)
+    playGame(board, transport, args.ponder)
 
-            if board.isFinished(col_player):
-                print("Game over, player wins")
-                break
+    if transport is not None:
+        print(transport.telemetry.summary())
+        if args.telemetry:
+            transport.telemetry.dump(args.telemetry)
 
         # release workers
-        for worker in readyWorkers:
-            comm.send("stop", worker)
-
-
-
-else:
-    while True:
-        continueWhile = False
-
-        comm.send(("ready", rank), 0)
-        data = comm.recv(source=0)
-        if data[0] == "task":
-            _, tasks, board = data
-
-            for move in tasks:
-                ok, fin = board.playTurn(move)
-                if not ok:
-                    comm.send(("result", rank, "error", None), 0)
-                    continueWhile = True
-                    break
-
-                if fin:
-                    comm.send(("result", rank, tasks, "success", board.calculateScore(move)), 0)
-                    continueWhile = True
-                    break
-
-            if continueWhile:
-                continue
-
-            column, score = board.gameSimulation()
+        transport.close()
 
-            comm.send(("result", rank, tasks, "success", score), 0)
 
-        else:
-            break
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import sys
+import time
+
+import numpy as np
+
+from connect4 import COMPUTER, PERSON, WIN_LENGTH, Board
+
+# A batch of random games played out at once. Every game is a (rows, columns) slice of one
+# int8 array, +1 for a computer piece and -1 for a person's, row 0 at the bottom. All the
+# games start from the same position, so they all have the same player to move at every ply
+# and a ply is a few array operations over the games still running.
+
+# row and column steps of the four line directions
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+def board_array(board):
+    grid = np.zeros((board.rows, board.columns), dtype=np.int8)
+
+    for c in range(board.columns):
+        for r in range(board.heights[c]):
+            grid[r, c] = 1 if board.masks[COMPUTER] >> (c * board.stride + r) & 1 else -1
+
+    return grid
+
+
+def wins(grids, piece, length=WIN_LENGTH):
+    # the games in which piece has length in a row anywhere, every direction checks all of
+    # its start cells at once as the AND of length shifted views of the board
+    games, rows, columns = grids.shape
+    mine = grids == piece
+    found = np.zeros(games, dtype=bool)
+
+    for dr, dc in DIRECTIONS:
+        height = rows - (length - 1) * dr
+        width = columns - (length - 1) * abs(dc)
+        if height <= 0 or width <= 0:
+            continue
+
+        first = (length - 1) if dc < 0 else 0
+        line = np.ones((games, height, width), dtype=bool)
+
+        for k in range(length):
+            r, c = k * dr, first + k * dc
+            line &= mine[:, r:r + height, c:c + width]
+
+        found |= line.any(axis=(1, 2))
+
+    return found
+
+
+def playouts(board, player, count, seed=None):
+    # the results of count random games from board with player to move: +1 where the
+    # computer won, -1 where the person did and 0 for a full board
+    generator = np.random.default_rng(seed)
+
+    if board.last_move_wins():
+        return np.full(count, 1 if board.last_player() == COMPUTER else -1, dtype=np.int8)
+
+    grids = np.repeat(board_array(board)[np.newaxis], count, axis=0)
+    heights = np.repeat(np.array([board.heights], dtype=np.int8), count, axis=0)
+    outcomes = np.zeros(count, dtype=np.int8)
+    running = np.arange(count)
+    piece = 1 if player == COMPUTER else -1
+
+    for _ in range(board.rows * board.columns - sum(board.heights)):
+        if len(running) == 0:
+            break
+
+        # a random open column for every running game: random keys, full columns never win
+        keys = generator.random((len(running), board.columns))
+        keys[heights[running] >= board.rows] = -1
+        columns = keys.argmax(axis=1)
+
+        rows = heights[running, columns]
+        grids[running, rows, columns] = piece
+        heights[running, columns] += 1
+
+        won = wins(grids[running], piece)
+        outcomes[running[won]] = piece
+        running = running[~won]
+
+        piece = -piece
+
+    return outcomes
+
+
+def evaluate(board, player, count, seed=None):
+    # the average result of count playouts, from the computer's side
+    return float(playouts(board, player, count, seed).mean()) if count > 0 else 0.0
+
+
+if __name__ == "__main__":
+    board = Board()
+    player = COMPUTER
+    for move in sys.argv[1] if len(sys.argv) > 1 else "":
+        board.play(int(move), player)
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    start_time = time.time()
+    outcomes = playouts(board, player, 10000)
+    seconds = time.time() - start_time
+
+    print("%d playouts in %.3f s: %d computer wins, %d person wins, %d draws"
+          % (len(outcomes), seconds, (outcomes == 1).sum(), (outcomes == -1).sum(), (outcomes == 0).sum()))
@@ -0,0 +1,238 @@
+import argparse
+import json
+import random
+import time
+
+import lab3
+from connect4 import BOARD_HEIGHT, BOARD_WIDTH, COMPUTER, EMPTY, PERSON, Board, Connect4
+from transport import LocalTransport, MPITransport
+
+# engines that search through Connect4, the rest are lab3's dfs, random moves and scripted moves
+ENGINES = ["minimax", "alphabeta", "mcts"]
+PLAYERS = ENGINES + ["lab3", "random", "script"]
+
+
+class EnginePlayer:
+    # searches the board the game is played on, so it keeps its table and tree for the whole game
+    def __init__(self, name, board, side, task):
+        self.side = side
+        self.engine = Connect4(board.columns, board.rows, depth=task["depth"], table_size=task["table_size"],
+                               engine=name, time_limit=task["time_limit"], iterations=task["iterations"],
+                               solve_below=task["solve_below"])
+        self.engine.board = board
+
+        if self.engine.tree is not None:
+            self.engine.tree.random.seed(task["seed"])
+
+    def move(self):
+        move, _ = self.engine.search(self.side)
+        return move
+
+    def played(self, column):
+        pass
+
+
+class Lab3Player:
+    # lab3's dfs on a field of its own, which follows every move of the game
+    def __init__(self, board, side, task):
+        lab3.H, lab3.W = board.rows, board.columns
+        self.depth = task["depth"]
+        self.field = lab3.Board(side == COMPUTER)
+
+    def move(self):
+        column, _ = self.field.gameSimulation(self.depth)
+        return column
+
+    def played(self, column):
+        self.field.playTurn(column)
+
+
+class RandomPlayer:
+    # the moves of the script while they can be played, then random ones
+    def __init__(self, board, generator, script=()):
+        self.board = board
+        self.generator = generator
+        self.script = list(script)
+
+    def move(self):
+        while len(self.script) > 0:
+            column = self.script.pop(0)
+            if column in Board.valid_moves(self.board):
+                return column
+
+        return self.generator.choice(Board.valid_moves(self.board))
+
+    def played(self, column):
+        pass
+
+
+def make_player(name, board, side, task, generator):
+    if name in ENGINES:
+        return EnginePlayer(name, board, side, task)
+    elif name == "lab3":
+        return Lab3Player(board, side, task)
+
+    return RandomPlayer(board, generator, task["script"] if name == "script" else ())
+
+
+def run_game(task, root):
+    # one whole game from root, the first player moves first; minimax breaks ties with the
+    # random module, so it is seeded too
+    random.seed(task["seed"])
+    generator = random.Random(task["seed"])
+
+    board = root.__copy__()
+    players = {COMPUTER: make_player(task["first"], board, COMPUTER, task, generator),
+               PERSON: make_player(task["second"], board, PERSON, task, generator)}
+
+    side = COMPUTER
+    moves = []
+    latencies = {COMPUTER: [], PERSON: []}
+    winner = EMPTY
+    start_time = time.perf_counter()
+
+    while sum(board.heights) < board.columns * board.rows:
+        if len(moves) < len(task["opening"]):
+            column = task["opening"][len(moves)]
+        else:
+            move_time = time.perf_counter()
+            column = players[side].move()
+            latencies[side].append(time.perf_counter() - move_time)
+
+        board.play(column, side)
+        for player in players.values():
+            player.played(column)
+        moves.append(column)
+
+        if board.last_move_wins():
+            winner = side
+            break
+
+        side = PERSON if side == COMPUTER else COMPUTER
+
+    return {"type": "result", "game": task["game"], "seed": task["seed"], "moves": moves,
+            "winner": {COMPUTER: "first", PERSON: "second", EMPTY: "draw"}[winner],
+            "seconds": time.perf_counter() - start_time,
+            "latencies": {"first": latencies[COMPUTER], "second": latencies[PERSON]}}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if len(values) == 0:
+        return 0
+
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(args, games, seconds):
+    moves = sum(len(game["moves"]) for game in games)
+    lines = ["Games: %d in %.3f s, %.2f games/s, %.1f moves/s"
+             % (len(games), seconds, len(games) / seconds if seconds > 0 else 0, moves / seconds if seconds > 0 else 0),
+             "Results: %s (first) %d, %s (second) %d, draws %d"
+             % (args.first, sum(game["winner"] == "first" for game in games),
+                args.second, sum(game["winner"] == "second" for game in games),
+                sum(game["winner"] == "draw" for game in games))]
+
+    for side, name in (("first", args.first), ("second", args.second)):
+        latencies = [latency for game in games for latency in game["latencies"][side]]
+        if len(latencies) > 0:
+            lines.append("Move latency %s (%s): p50 %.4f s, p90 %.4f s, p99 %.4f s, max %.4f s"
+                         % (name, side, percentile(latencies, 0.5), percentile(latencies, 0.9),
+                            percentile(latencies, 0.99), max(latencies)))
+
+    return "\n".join(lines)
+
+
+def replay(path, number=None):
+    # prints the board after every move of the recorded games
+    with open(path) as file:
+        for line in file:
+            game = json.loads(line)
+            if number is not None and game["game"] != number:
+                continue
+
+            print("Game %d: %s against %s, %s won" % (game["game"], game["first"], game["second"], game["winner"]))
+
+            board = Board(game["width"], game["height"])
+            side = COMPUTER
+            for column in game["moves"]:
+                board.play(column, side)
+                print(board)
+                side = PERSON if side == COMPUTER else COMPUTER
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play games engine against engine, without anyone at the keyboard")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--first", choices=PLAYERS, default="alphabeta")
+    parser.add_argument("--second", choices=PLAYERS, default="random")
+    parser.add_argument("--depth", type=int, default=4, help="search depth of minimax, alphabeta and lab3")
+    parser.add_argument("--time-limit", type=float, help="seconds per move of minimax, alphabeta and mcts")
+    parser.add_argument("--iterations", type=int, help="playouts per move of mcts")
+    parser.add_argument("--table-size", type=int, help="transposition table entries of each engine")
+    parser.add_argument("--solve-below", type=int, metavar="CELLS",
+                        help="engines solve positions with at most this many empty cells exactly")
+    parser.add_argument("--opening", default="", help="columns every game starts with, like 3324")
+    parser.add_argument("--script", default="", help="columns the script player tries first, like 3241")
+    parser.add_argument("--seed", type=int, default=0, help="game i is played with seed + i")
+    parser.add_argument("--width", type=int, default=BOARD_WIDTH)
+    parser.add_argument("--height", type=int, default=BOARD_HEIGHT)
+    parser.add_argument("--local", type=int, metavar="PROCESSES",
+                        help="play on a local process pool instead of MPI ranks")
+    parser.add_argument("--records", metavar="PATH", help="write every game as a line of JSON")
+    parser.add_argument("--replay", metavar="PATH", help="print the games of a records file instead of playing")
+    parser.add_argument("--game", type=int, help="the game of --replay to print, all by default")
+    parser.add_argument("--telemetry", metavar="PATH", help="also write the per rank telemetry as JSON")
+    args = parser.parse_args()
+
+    if args.replay:
+        replay(args.replay, args.game)
+        return
+
+    transport = LocalTransport(args.local) if args.local else MPITransport()
+    if transport.rank != 0:
+        transport.serve(run_game)
+        return
+
+    tasks = [{"game": i, "seed": args.seed + i, "first": args.first, "second": args.second, "depth": args.depth,
+              "time_limit": args.time_limit, "iterations": args.iterations, "table_size": args.table_size,
+              "solve_below": args.solve_below, "opening": [int(c) for c in args.opening],
+              "script": [int(c) for c in args.script]}
+             for i in range(args.games)]
+
+    # tasks go out from the end of the list
+    tasks.reverse()
+    games = []
+
+    start_time = time.time()
+    transport.telemetry.start_turn("selfplay")
+    transport.broadcast(Board(args.width, args.height))
+
+    records = open(args.records, "w") if args.records else None
+    for game in transport.farm(tasks, run_game):
+        games.append(game)
+        print("Game %d: %s won in %d moves, %.3f s" % (game["game"], game["winner"], len(game["moves"]),
+                                                         game["seconds"]))
+
+        if records is not None:
+            record = {"game": game["game"], "seed": game["seed"], "first": args.first, "second": args.second,
+                      "width": args.width, "height": args.height, "moves": game["moves"], "winner": game["winner"],
+                      "seconds": game["seconds"], "latencies": game["latencies"]}
+            records.write(json.dumps(record) + "\n")
+
+    transport.telemetry.end_turn()
+    seconds = time.time() - start_time
+
+    if records is not None:
+        records.close()
+
+    print(report(args, sorted(games, key=lambda game: game["game"]), seconds))
+    print(transport.telemetry.summary())
+    if args.telemetry:
+        transport.telemetry.dump(args.telemetry)
+
+    transport.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import json
+import time
+
+
+# Per turn and per rank counters filled in by the transports. The game marks where a turn
+# starts and ends, anything the transport does outside a turn is not recorded. Rank 0 is
+# the master: its busy time is the turn minus what it spent waiting for workers. Every farm
+# that runs to the end adds its makespan, from the first task out to the last result in,
+# and the makespan an ideal schedule would get: the work spread evenly over the workers,
+# but never less than the longest task.
+class Telemetry:
+    def __init__(self, size):
+        self.size = size
+        self.turns = []
+        self.turn = None
+
+    def start_turn(self, kind="search"):
+        self.turn = {"turn": len(self.turns) + 1, "kind": kind, "start": time.time(), "seconds": 0,
+                     "waiting": 0, "tail": 0, "drained": None, "last_task": 0,
+                     "makespan": 0, "ideal": 0, "farm": None,
+                     "ranks": {rank: {"tasks": 0, "busy": 0, "idle": 0, "messages_sent": 0,
+                                      "messages_received": 0, "bytes_sent": 0, "bytes_received": 0,
+                                      "last_task": 0, "dispatched": []}
+                               for rank in range(self.size)}}
+
+    def end_turn(self):
+        if self.turn is None:
+            return
+
+        turn = self.turn
+        turn["seconds"] = time.time() - turn.pop("start")
+        turn.pop("drained")
+        turn.pop("farm")
+
+        master = turn["ranks"][0]
+        master["busy"] = max(0, turn["seconds"] - turn["waiting"])
+        master["idle"] = turn["waiting"]
+
+        for rank, counters in turn["ranks"].items():
+            counters.pop("dispatched")
+            if rank > 0:
+                counters["idle"] = max(0, turn["seconds"] - counters["busy"])
+
+        self.turns.append(turn)
+        self.turn = None
+
+    def rank(self, rank):
+        # workers outside the ranks the turn started with, like new pool processes, are added
+        if rank not in self.turn["ranks"]:
+            self.turn["ranks"][rank] = {"tasks": 0, "busy": 0, "idle": 0, "messages_sent": 0,
+                                        "messages_received": 0, "bytes_sent": 0, "bytes_received": 0,
+                                        "last_task": 0, "dispatched": []}
+
+        return self.turn["ranks"][rank]
+
+    def sent(self, rank, size):
+        if self.turn is not None:
+            counters = self.rank(rank)
+            counters["messages_sent"] += 1
+            counters["bytes_sent"] += size
+
+    def received(self, rank, size):
+        if self.turn is not None:
+            counters = self.rank(rank)
+            counters["messages_received"] += 1
+            counters["bytes_received"] += size
+
+    def dispatched(self, rank):
+        # a worker can have several tasks queued, they come back in the order they went out
+        if self.turn is not None:
+            self.rank(rank)["dispatched"].append(time.time())
+
+    def completed(self, rank, seconds, stale=False):
+        # seconds is what the worker spent on the task, the latency also counts the messages; a
+        # stale task kept its worker busy, but is no part of the farm it came back in
+        if self.turn is None:
+            return
+
+        counters = self.rank(rank)
+        counters["tasks"] += 1
+        counters["busy"] += seconds
+
+        latency = seconds
+        if len(counters["dispatched"]) > 0:
+            latency = time.time() - counters["dispatched"].pop(0)
+
+        counters["last_task"] = latency
+        self.turn["last_task"] = latency
+
+        farm = self.turn["farm"]
+        if farm is not None and not stale:
+            farm["work"] += seconds
+            farm["longest"] = max(farm["longest"], seconds)
+
+    def waited(self, seconds):
+        if self.turn is not None:
+            self.turn["waiting"] += seconds
+
+    def started(self, workers):
+        # a farm is about to hand out its first task
+        if self.turn is not None:
+            self.turn["farm"] = {"start": time.time(), "workers": workers, "work": 0, "longest": 0}
+
+    def drained(self):
+        # the last task went out, from here on finished workers have nothing to do
+        if self.turn is not None and self.turn["drained"] is None:
+            self.turn["drained"] = time.time()
+
+    def finished(self):
+        # the end of a farm, what it took after the last task went out is lost to stragglers
+        if self.turn is not None and self.turn["drained"] is not None:
+            self.turn["tail"] += time.time() - self.turn["drained"]
+            self.turn["drained"] = None
+
+        if self.turn is not None and self.turn["farm"] is not None:
+            farm = self.turn["farm"]
+            self.turn["makespan"] += time.time() - farm["start"]
+            self.turn["ideal"] += max(farm["work"] / max(1, farm["workers"]), farm["longest"])
+            self.turn["farm"] = None
+
+    def summary(self):
+        seconds = sum(turn["seconds"] for turn in self.turns)
+        tail = sum(turn["tail"] for turn in self.turns)
+        makespan = sum(turn["makespan"] for turn in self.turns)
+        ideal = sum(turn["ideal"] for turn in self.turns)
+
+        lines = ["Telemetry: %d turns, %.3f s, %.3f s (%.1f%%) after the last task went out"
+                 % (len(self.turns), seconds, tail, 100 * tail / seconds if seconds > 0 else 0),
+                 "Makespan: %.3f s, an ideal schedule %.3f s (%.1f%%)"
+                 % (makespan, ideal, 100 * ideal / makespan if makespan > 0 else 0),
+                 "%4s %7s %9s %9s %6s %13s %19s %11s"
+                 % ("rank", "tasks", "busy s", "idle s", "util", "msgs out/in", "bytes out/in", "last task")]
+
+        ranks = sorted(set(rank for turn in self.turns for rank in turn["ranks"]))
+        for rank in ranks:
+            counters = [turn["ranks"][rank] for turn in self.turns if rank in turn["ranks"]]
+            busy = sum(c["busy"] for c in counters)
+            idle = sum(c["idle"] for c in counters)
+
+            lines.append("%4d %7d %9.3f %9.3f %5.1f%% %6d/%-6d %9d/%-9d %10.3fs"
+                         % (rank, sum(c["tasks"] for c in counters), busy, idle,
+                            100 * busy / (busy + idle) if busy + idle > 0 else 0,
+                            sum(c["messages_sent"] for c in counters), sum(c["messages_received"] for c in counters),
+                            sum(c["bytes_sent"] for c in counters), sum(c["bytes_received"] for c in counters),
+                            max([c["last_task"] for c in counters] + [0])))
+
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            json.dump({"size": self.size, "turns": self.turns}, file, indent=2)
@@ -0,0 +1,53 @@
+import math
+
+from connect4 import COMPUTER, PERSON
+from connect4_mpi import ENGINES, BinaryCodec, Board
+
+
+def task(**fields):
+    task = {"moves": (), "type": "minimax", "engine": "minimax", "depth": 4, "time_limit": None,
+            "iterations": 0, "seed": 0}
+    task.update(fields)
+
+    return task
+
+
+def testTaskRoundTrip():
+    for fields in [{}, {"depth": 0}, {"depth": 255}, {"depth": 256}, {"depth": 65535},
+                   {"moves": tuple(range(7)) * 40, "depth": 1000}, {"moves": (255,) * 65535},
+                   {"time_limit": 0.25, "iterations": 2 ** 32 - 1, "seed": 2 ** 32 - 1}]:
+        for engine in ENGINES:
+            sent = task(engine=engine, **fields)
+            assert BinaryCodec.decode_task(BinaryCodec.encode_task(sent)) == sent
+
+
+def testNoTimeLimit():
+    assert BinaryCodec.decode_task(BinaryCodec.encode_task(task(time_limit=None)))["time_limit"] is None
+    assert not math.isnan(BinaryCodec.decode_task(BinaryCodec.encode_task(task(time_limit=1.5)))["time_limit"])
+
+
+def testResultRoundTrip():
+    results = [{"type": "result", "best_move": None, "score": -0.5, "moves": (), "hits": 0, "misses": 0, "nodes": 0},
+               {"type": "result", "best_move": 255, "score": 1.0, "moves": (3,) * 300, "hits": 2 ** 32 - 1,
+                "misses": 2 ** 32 - 1, "nodes": 2 ** 32 - 1},
+               {"type": "result", "best_move": None, "score": 0, "moves": (1, 2), "hits": 1, "misses": 2,
+                "nodes": 500, "visits": [10] * 300, "values": [-2.5] * 300},
+               {"type": "cancelled", "moves": (6,) * 256, "hits": 3, "misses": 4, "nodes": 5}]
+
+    for sent in results:
+        assert BinaryCodec.decode_result(BinaryCodec.encode_result(sent)) == sent
+
+
+def testRootRoundTrip():
+    board = Board()
+    player = COMPUTER
+    for move in [3, 3, 2, 4, 6]:
+        board.play(move, player)
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    received = BinaryCodec.decode_root(BinaryCodec.encode_root(board))
+
+    assert received.masks == board.masks
+    assert received.heights == board.heights
+    assert received.hash == board.hash
+    assert received.mirror_hash == board.mirror_hash
@@ -0,0 +1,296 @@
+import random
+
+import numpy as np
+import pytest
+
+import lab3
+
+# board sizes and line lengths the int8 field is checked on
+SIZES = [(6, 7, 4), (5, 5, 3), (8, 8, 5)]
+
+
+class StringBoard:
+    # lab3's Board as it was with a field of "." "C" "P" strings, scanning the field for the top
+    # piece and walking out from it for wins; no cache and no stop flag, the rest as it was
+    def __init__(self, isComputerFirst, h, w, winLen):
+        self.H, self.W, self.winLen = h, w, winLen
+        self.field = np.array([["."] * w for _ in range(h)])
+
+        if isComputerFirst:
+            self.nextPiece = "C"
+        else:
+            self.nextPiece = "P"
+
+    def findFirst(self, col):
+        for i in range(0, self.H):
+            if self.field[i][col] != ".":
+                return i, True
+
+        return self.H, False
+
+    def checkVertical(self, row, col):
+        leng = 0
+        for i in range(self.winLen):
+            if row + i >= self.H:
+                return False
+
+            if self.field[row][col] != self.field[row + i][col]:
+                return False
+
+            leng += 1
+            if leng >= self.winLen:
+                return True
+
+    def checkHorizontal(self, row, col):
+        lenL = 0
+        lenR = 0
+        for i in range(1, self.winLen):
+            if col - i < 0:
+                break
+
+            if self.field[row][col] != self.field[row][col - i]:
+                break
+
+            lenL += 1
+
+        for i in range(1, self.winLen):
+            if col + i >= self.W:
+                break
+
+            if self.field[row][col] != self.field[row][col + i]:
+                break
+
+            lenR += 1
+
+        return lenL + lenR + 1 >= self.winLen
+
+    def checkFirstDiagonal(self, row, col):  # /
+        lenL = 0
+        lenR = 0
+        for i in range(1, self.winLen):
+            if col - i < 0 or row + i >= self.H:
+                break
+
+            if self.field[row][col] != self.field[row + i][col - i]:
+                break
+
+            lenL += 1
+
+        for i in range(1, self.winLen):
+            if col + i >= self.W or row - i < 0:
+                break
+
+            if self.field[row][col] != self.field[row - i][col + i]:
+                break
+
+            lenR += 1
+
+        return lenL + lenR + 1 >= self.winLen
+
+    def checkSecondDiagonal(self, row, col):  # \
+        lenL = 0
+        lenR = 0
+        for i in range(1, self.winLen):
+            if col - i < 0 or row - i < 0:
+                break
+
+            if self.field[row][col] != self.field[row - i][col - i]:
+                break
+
+            lenL += 1
+
+        for i in range(1, self.winLen):
+            if col + i >= self.W or row + i >= self.H:
+                break
+
+            if self.field[row][col] != self.field[row + i][col + i]:
+                break
+
+            lenR += 1
+
+        return lenL + lenR + 1 >= self.winLen
+
+    def isFinished(self, col):
+        row, _ = self.findFirst(col)
+
+        return bool(self.checkVertical(row, col) or self.checkHorizontal(row, col)
+                    or self.checkFirstDiagonal(row, col) or self.checkSecondDiagonal(row, col))
+
+    def calculateScore(self, col):
+        if not self.isFinished(col):
+            return 0
+
+        row, _ = self.findFirst(col)
+        if self.field[row][col] == "P":
+            return -1
+
+        return 1
+
+    def rotatePiece(self):
+        if self.nextPiece == "P":
+            self.nextPiece = "C"
+        else:
+            self.nextPiece = "P"
+
+    def playTurn(self, col):
+        if self.field[0][col] != ".":
+            return False, None
+
+        row, _ = self.findFirst(col)
+        row -= 1
+
+        self.field[row][col] = self.nextPiece
+        self.rotatePiece()
+        return True, self.isFinished(col)
+
+    def revertTurn(self, col):
+        row, _ = self.findFirst(col)
+
+        self.field[row][col] = "."
+        self.rotatePiece()
+
+    def gameSimulation(self, maxDepth):
+        bestCol = -1
+        maxScore = -2
+        for i in range(self.W):
+            result = self.dfs(i, 0, maxDepth)
+            if result is not None and result > maxScore:
+                bestCol = i
+                maxScore = result
+
+        return bestCol, maxScore
+
+    def dfs(self, col, depth, maxDepth):
+        ok, fin = self.playTurn(col)
+        if not ok:
+            return None
+        if fin or depth == maxDepth - 1:
+            score = self.calculateScore(col)
+            self.revertTurn(col)
+            return score
+
+        results = []
+        for i in range(self.W):
+            result = self.dfs(i, depth + 1, maxDepth)
+            if result is not None:
+                results.append(result)
+
+        self.revertTurn(col)
+        if len(results) == 0:
+            return None
+
+        if self.nextPiece == "P" and -1 in results:
+            return -1
+
+        if self.nextPiece == "C" and 1 in results:
+            return 1
+
+        return sum(results) / len(results)
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: "%dx%d-%d" % size)
+def size(request, monkeypatch):
+    h, w, length = request.param
+    monkeypatch.setattr(lab3, "H", h)
+    monkeypatch.setattr(lab3, "W", w)
+    monkeypatch.setattr(lab3, "winLen", length)
+
+    return request.param
+
+
+@pytest.fixture(params=[True, False], ids=["cache", "no-cache"])
+def cache(request, monkeypatch):
+    monkeypatch.setattr(lab3, "cache", lab3.Cache() if request.param else lab3.Cache(0))
+
+    return request.param
+
+
+def boards(size, isComputerFirst=True):
+    return lab3.Board(isComputerFirst), StringBoard(isComputerFirst, *size)
+
+
+def assertSame(board, old):
+    assert (lab3.pieceNames[board.field] == old.field).all()
+    assert lab3.pieceNames[board.nextPiece] == old.nextPiece
+    for col in range(old.W):
+        assert board.findFirst(col) == old.findFirst(col)
+
+
+def randomPosition(size, seed):
+    # both boards after a few of the same random moves, stopping short of a win; the early
+    # positions are the ones with the most near ties between columns
+    board, old = boards(size)
+    generator = random.Random(seed)
+
+    for _ in range(generator.randrange(9)):
+        col = generator.randrange(size[1])
+        ok, fin = board.playTurn(col)
+        assert (ok, fin) == old.playTurn(col)
+
+        if fin:
+            board.revertTurn(col)
+            old.revertTurn(col)
+            break
+
+    return board, old
+
+
+def testPlayAndRevert(size):
+    board, old = boards(size)
+    generator = random.Random(1)
+    played = []
+
+    for _ in range(4 * size[0] * size[1]):
+        col = generator.randrange(size[1])
+        result = board.playTurn(col)
+        assert result == old.playTurn(col)
+
+        if result[0]:
+            played.append(col)
+            assert board.calculateScore(col) == old.calculateScore(col)
+        assertSame(board, old)
+
+        if result[1] or (not result[0] and generator.random() < 0.5):
+            while len(played) > 0 and generator.random() < 0.7:
+                col = played.pop()
+                board.revertTurn(col)
+                old.revertTurn(col)
+                assertSame(board, old)
+
+    assert board.isFull() == all(old.field[0][col] != "." for col in range(size[1]))
+
+
+def testFullColumn(size):
+    # a full column is no move, searchMove leaves the board as it was
+    board, old = boards(size)
+    for _ in range(size[0]):
+        board.playTurn(0)
+        old.playTurn(0)
+
+    assert board.playTurn(0) == old.playTurn(0) == (False, None)
+    assert board.searchMove(0, 0, 3) is None
+    assertSame(board, old)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def testGameSimulation(size, cache, seed):
+    board, old = randomPosition(size, seed)
+    depth = 4 if size[1] < 8 else 3
+
+    assert board.gameSimulation(depth) == old.gameSimulation(depth)
+    assertSame(board, old)
+
+
+def testWholeGame(size, cache):
+    # the cache is kept from move to move, as in a game
+    board, old = boards(size)
+    for _ in range(size[0] * size[1]):
+        col, score = board.gameSimulation(3)
+        assert (col, score) == old.gameSimulation(3)
+        if col < 0:
+            break
+
+        ok, fin = board.playTurn(col)
+        assert (ok, fin) == old.playTurn(col)
+        if fin:
+            break
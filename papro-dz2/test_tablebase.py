@@ -0,0 +1,66 @@
+from connect4 import BOOK_ENTRY, COMPUTER, PERSON, TABLEBASE_HEADER, Board, Tablebase
+
+
+def solved(tablebase, moves):
+    board = Board()
+    player = COMPUTER
+    for move in moves:
+        board.play(move, player)
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    tablebase.put(board, player, moves[0], 0.5)
+
+    return board, player
+
+
+def testReopen(tmp_path):
+    path = str(tmp_path / "tablebase")
+    tablebase = Tablebase(path)
+    board, player = solved(tablebase, [3, 2])
+    tablebase.save()
+
+    assert Tablebase(path).get(board, player) == (3, 0.5)
+
+
+def testEmptyFile(tmp_path):
+    path = tmp_path / "tablebase"
+    path.write_bytes(b"")
+
+    tablebase = Tablebase(str(path))
+    assert len(tablebase) == 0
+
+    board, player = solved(tablebase, [3, 2])
+    tablebase.save()
+    assert Tablebase(str(path)).get(board, player) == (3, 0.5)
+
+
+def testPartialHeader(tmp_path):
+    path = tmp_path / "tablebase"
+    path.write_bytes(b"C4")
+
+    assert len(Tablebase(str(path))) == 0
+
+
+def testPartialEntry(tmp_path):
+    # a run killed in the middle of a save, the entries after the cut are appended where it was
+    path = tmp_path / "tablebase"
+    tablebase = Tablebase(str(path))
+    first, first_player = solved(tablebase, [3, 2])
+    solved(tablebase, [3, 4, 1])
+    tablebase.save()
+
+    data = path.read_bytes()
+    assert len(data) == TABLEBASE_HEADER.size + 2 * BOOK_ENTRY.size
+    path.write_bytes(data[:-5])
+
+    tablebase = Tablebase(str(path))
+    assert len(tablebase) == 1
+    assert tablebase.get(first, first_player) == (3, 0.5)
+
+    board, player = solved(tablebase, [0, 0, 0])
+    tablebase.save()
+
+    reopened = Tablebase(str(path))
+    assert len(reopened) == 2
+    assert reopened.get(first, first_player) == (3, 0.5)
+    assert reopened.get(board, player) == (0, 0.5)
@@ -0,0 +1,180 @@
+import os
+import random
+import time
+
+import pytest
+
+from connect4 import COMPUTER, PERSON, Connect4
+import connect4_mpi
+from connect4_mpi import BinaryCodec, Board, Connect4MPI
+from transport import LocalTransport
+
+
+def echo(task, root):
+    return {"type": "result", "id": task["id"], "root": root}
+
+
+def wait(task, root):
+    # task 0 is back right away, the others run until their epoch is over and mark in the
+    # directory they get as root that they started and that they were stopped
+    if task["id"] == 0:
+        return {"type": "result", "id": 0}
+
+    open(os.path.join(root, "started-%d" % task["id"]), "w").close()
+
+    end_time = time.time() + 30
+    while not task["stop"].is_set() and time.time() < end_time:
+        time.sleep(0.01)
+
+    if task["stop"].is_set():
+        open(os.path.join(root, "stopped-%d" % task["id"]), "w").close()
+
+    return {"type": "result", "id": task["id"]}
+
+
+@pytest.fixture
+def transport():
+    transport = LocalTransport(2)
+    yield transport
+    transport.close()
+
+
+def openFiles():
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="counts open files through /proc")
+def testManyBroadcasts(transport):
+    # every broadcast makes a new block, the old ones have to go or a long game runs out of files
+    transport.broadcast(0)
+    list(transport.farm([{"id": 0}], echo))
+    before = openFiles()
+
+    for i in range(1500):
+        transport.broadcast(i)
+        if i % 100 == 0:
+            results = list(transport.farm([{"id": j} for j in range(4)], echo))
+            assert sorted(result["id"] for result in results) == list(range(4))
+            assert all(result["root"] == i for result in results)
+
+    assert len(transport.memories) <= 2
+    assert openFiles() - before < 10
+
+
+def testFarm(transport):
+    transport.broadcast("root")
+    tasks = [{"id": i} for i in range(20)]
+
+    results = list(transport.farm(tasks, echo))
+
+    assert len(tasks) == 0
+    assert sorted(result["id"] for result in results) == list(range(20))
+    assert all(result["root"] == "root" for result in results)
+
+
+def testClosedFarmCancels(transport, tmp_path):
+    # task 0 goes out first; once the caller stops reading, the tasks that are queued never
+    # start and the running ones give up, so the pool is free for the next farm right away
+    transport.broadcast(str(tmp_path))
+    tasks = [{"id": i} for i in range(1, 9)] + [{"id": 0}]
+
+    results = transport.farm(tasks, wait)
+    assert next(results)["id"] == 0
+    results.close()
+
+    start_time = time.time()
+    transport.broadcast("root")
+    assert len(list(transport.farm([{"id": i} for i in range(4)], echo))) == 4
+    assert time.time() - start_time < 10
+
+    assert len(tasks) > 0
+    started = {name.split("-")[1] for name in os.listdir(tmp_path) if name.startswith("started")}
+    assert len(started) < 8
+
+    end_time = time.time() + 10
+    while time.time() < end_time:
+        stopped = {name.split("-")[1] for name in os.listdir(tmp_path) if name.startswith("stopped")}
+        if stopped == started:
+            break
+        time.sleep(0.05)
+    assert stopped == started
+
+
+@pytest.fixture(scope="module")
+def pool():
+    transport = LocalTransport(2, codec=BinaryCodec())
+    yield transport
+    transport.close()
+
+
+def endgame(seed, empty):
+    # a random position with the computer to move, empty cells left and nobody won yet
+    generator = random.Random(seed)
+
+    while True:
+        board = Board()
+        player = COMPUTER
+
+        while board.columns * board.rows - sum(board.heights) > empty and not board.last_move_wins():
+            board.play(generator.choice(Board.valid_moves(board)), player)
+            player = PERSON if player == COMPUTER else COMPUTER
+
+        if not board.last_move_wins() and player == COMPUTER:
+            return board
+
+
+@pytest.mark.parametrize("seed", range(4))
+def testSolveMatchesSequential(pool, seed):
+    # the farmed solve scores every column exactly, the column the sequential solve picks has
+    # the best score, and it is the score the sequential solve found
+    board = endgame(seed, 12)
+
+    sequential = Connect4(solve_below=12)
+    sequential.board = board.__copy__()
+    move, score = sequential.search(COMPUTER)
+
+    parallel = Connect4MPI(solve_below=12, transport=pool)
+    parallel.board = board.__copy__()
+    aggregated = parallel.search()
+
+    assert max(aggregated.values()) == score
+    assert aggregated[move] == score
+
+
+@pytest.mark.parametrize("engine", ["minimax", "alphabeta"])
+def testWinningMove(pool, engine):
+    # three in a row along the bottom, only column 3 wins right away
+    moves = [0, 6, 1, 6, 2, 5]
+
+    sequential = Connect4(depth=4, engine=engine)
+    parallel = Connect4MPI(depth=4, engine=engine, transport=pool)
+    parallel.board = Board()
+
+    player = COMPUTER
+    for move in moves:
+        sequential.board.play(move, player)
+        parallel.board.play(move, player)
+        player = PERSON if player == COMPUTER else COMPUTER
+
+    aggregated = parallel.search()
+
+    assert sequential.search(COMPUTER)[0] == 3
+    assert max(aggregated, key=aggregated.get) == 3
+
+
+def cacheSize(task, root):
+    return {"type": "result", "size": connect4_mpi.CACHE_SIZE, "cache": connect4_mpi.worker_cache("minimax")}
+
+
+def testCacheSize():
+    # the workers get the cache size from the initializer, not from the master's globals
+    transport = LocalTransport(2, initializer=connect4_mpi.set_cache_size, initargs=(0,))
+    transport.broadcast(None)
+
+    try:
+        results = list(transport.farm([{"id": i} for i in range(4)], cacheSize))
+    finally:
+        transport.close()
+
+    assert connect4_mpi.CACHE_SIZE == 1 << 18
+    assert all(result["size"] == 0 and result["cache"] is None for result in results)
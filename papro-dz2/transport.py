@@ -0,0 +1,482 @@
+import os
+import pickle
+import struct
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+
+from telemetry import Telemetry
+
+
+# Both transports farm out task dicts to a handler and hand back whatever dicts the
+# handler returns, in the order they finish. Tasks go out from the end of the list, so
+# the ones a caller wants started first go last. The position a round of tasks starts from
+# is broadcast once with broadcast(root), which starts a new epoch; the handler is then
+# called as handler(task, root) and must leave root as it found it. Tasks and results
+# from an older epoch are dropped. If a deadline is given, tasks that have not been
+# handed out when it passes are left in the task list and every task that does go out
+# gets the remaining budget in seconds as task["time_limit"]. A task can name the
+# positions it continues from in task["affinity"], its own first; MPI workers are then
+# handed the tasks below what they searched in this or the previous epoch first, so
+# their caches keep paying off. The key is taken out before the task is sent. A caller
+# can stop reading results early; the transport then starts a new epoch with the same
+# root, so what is still running is dropped with the old one. A worker's handler finds
+# task["stop"], which behaves like a threading.Event and is set once its epoch is over,
+# so a long search can give up instead of finishing for nothing. Each transport fills in
+# a Telemetry for the turns the caller marks on it.
+
+# MPI message tags, the payload is whatever the codec makes of a task, a result or a root
+TASK, RESULT, END, ROOT, STALE = 2, 3, 4, 5, 6
+
+# every task, result and root is prefixed with the epoch it belongs to, results also carry
+# the seconds the worker spent on the task
+EPOCH = struct.Struct("<I")
+RESULT_HEADER = struct.Struct("<Id")
+
+
+class PickleCodec:
+    @staticmethod
+    def encode_task(task):
+        return pickle.dumps(task)
+
+    @staticmethod
+    def decode_task(data):
+        return pickle.loads(data)
+
+    @staticmethod
+    def encode_result(result):
+        return pickle.dumps(result)
+
+    @staticmethod
+    def decode_result(data):
+        return pickle.loads(data)
+
+    @staticmethod
+    def encode_root(root):
+        return pickle.dumps(root)
+
+    @staticmethod
+    def decode_root(data):
+        return pickle.loads(data)
+
+
+def expired(deadline):
+    return deadline is not None and time.time() >= deadline
+
+
+def stamp(task, deadline):
+    if deadline is not None:
+        task["time_limit"] = deadline - time.time()
+
+    return task
+
+
+class Superseded:
+    # task["stop"] on a worker, it asks the transport whether a newer epoch has started
+    def __init__(self, check):
+        self.check = check
+
+    def is_set(self):
+        return self.check()
+
+
+class MPITransport:
+    def __init__(self, comm=None, codec=None, prefetch=2, compute=True):
+        from mpi4py import MPI
+
+        self.MPI = MPI
+        self.comm = comm if comm is not None else MPI.COMM_WORLD
+        self.size = self.comm.Get_size()
+        self.rank = self.comm.Get_rank()
+        self.codec = codec if codec is not None else PickleCodec()
+
+        # tasks every worker gets ahead of time, so it never waits for the master between two
+        # of them; rank 0 runs tasks itself whenever no message is waiting
+        self.prefetch = prefetch
+        self.compute = compute
+
+        # epochs of the tasks sent to each worker that have not come back yet, oldest first;
+        # they can be older than the current one if a farm was left early
+        self.inflight = {rank: [] for rank in range(1, self.size)}
+
+        # non-blocking sends with the buffers they read from
+        self.sends = []
+
+        self.epoch = 0
+        self.root = None
+        self.broadcasts = []
+
+        # rank 0 decodes its own copy of the root to run tasks on
+        self.local_root = None
+
+        # worker that got each affinity key, for this epoch and the one before
+        self.owners = {}
+        self.last_owners = {}
+
+        self.telemetry = Telemetry(self.size)
+
+    @property
+    def workers(self):
+        return self.size if self.compute else self.size - 1
+
+    def send(self, data, dest, tag):
+        self.comm.Send([data, self.MPI.BYTE], dest=dest, tag=tag)
+        self.telemetry.sent(dest, len(data))
+
+    def isend(self, data, dest, tag):
+        self.sends.append((self.comm.Isend([data, self.MPI.BYTE], dest=dest, tag=tag), data))
+        self.telemetry.sent(dest, len(data))
+
+    def recv(self, source):
+        # messages are plain byte buffers, so look at the size first
+        status = self.MPI.Status()
+        self.comm.Probe(source=source, tag=self.MPI.ANY_TAG, status=status)
+
+        data = bytearray(status.Get_count(self.MPI.BYTE))
+        self.comm.Recv([data, self.MPI.BYTE], source=status.Get_source(), tag=status.Get_tag())
+        self.telemetry.received(status.Get_source(), len(data))
+
+        return status.Get_source(), status.Get_tag(), data
+
+    def serve(self, handler):
+        epoch, root = None, None
+        queue = []
+        done = False
+
+        # roots come in order and are all taken in before a task starts, so one that is waiting
+        # belongs to a newer epoch than the running task
+        stop = Superseded(lambda: self.comm.Iprobe(source=0, tag=ROOT))
+
+        while True:
+            # wait for work only when there is none, then take in everything that has arrived
+            if len(queue) == 0:
+                messages = [self.recv(source=0)]
+            else:
+                messages = []
+
+            while self.comm.Iprobe(source=0, tag=self.MPI.ANY_TAG):
+                messages.append(self.recv(source=0))
+
+            for _, tag, data in messages:
+                if tag == ROOT:
+                    epoch, = EPOCH.unpack_from(data)
+                    root = self.codec.decode_root(data[EPOCH.size:])
+                elif tag == TASK:
+                    queue.append(data)
+                elif tag == END:
+                    done = True
+
+            if done:
+                break
+
+            if len(queue) == 0:
+                continue
+
+            # tasks queued before a newer root are answered without running them
+            data = queue.pop(0)
+            task_epoch, = EPOCH.unpack_from(data)
+
+            if task_epoch != epoch:
+                self.send(EPOCH.pack(task_epoch), dest=0, tag=STALE)
+                continue
+
+            task = self.codec.decode_task(data[EPOCH.size:])
+            task["stop"] = stop
+
+            start_time = time.perf_counter()
+            result = handler(task, root)
+            seconds = time.perf_counter() - start_time
+
+            self.send(RESULT_HEADER.pack(epoch, seconds) + self.codec.encode_result(result), dest=0, tag=RESULT)
+
+    def broadcast(self, root):
+        self.send_root(self.codec.encode_root(root))
+        self.last_owners, self.owners = self.owners, {}
+
+        if self.compute:
+            self.local_root = self.codec.decode_root(self.root[EPOCH.size:])
+
+    def cancel(self):
+        # the same root under a new epoch, the tasks of the old one stop once they see it
+        self.send_root(self.root[EPOCH.size:])
+
+    def send_root(self, data):
+        # the previous root has to be out before its buffer goes away
+        self.MPI.Request.Waitall(self.broadcasts)
+
+        self.epoch += 1
+        self.root = EPOCH.pack(self.epoch) + data
+
+        # non-blocking, a busy worker picks it up before its next task
+        self.broadcasts = [self.comm.Isend([self.root, self.MPI.BYTE], dest=i, tag=ROOT)
+                           for i in range(1, self.size)]
+
+        for i in range(1, self.size):
+            self.telemetry.sent(i, len(self.root))
+
+    def owner(self, task):
+        for key in task.get("affinity", ()):
+            rank = self.owners.get(key, self.last_owners.get(key))
+            if rank is not None:
+                return rank
+
+        return None
+
+    def pick(self, tasks, rank):
+        # tasks go out from the end, but one this worker owns comes first and one nobody owns
+        # comes before one another worker owns
+        free = None
+
+        for i in range(len(tasks) - 1, -1, -1):
+            owner = self.owner(tasks[i])
+            if owner == rank:
+                return i
+            if owner is None and free is None:
+                free = i
+
+        return free if free is not None else len(tasks) - 1
+
+    def take(self, tasks, rank, deadline):
+        task = tasks.pop(self.pick(tasks, rank))
+
+        affinity = task.pop("affinity", ())
+        if len(affinity) > 0:
+            self.owners[affinity[0]] = rank
+
+        if len(tasks) == 0:
+            self.telemetry.drained()
+
+        return stamp(task, deadline)
+
+    def dispatch(self, tasks, rank, deadline):
+        task = self.codec.encode_task(self.take(tasks, rank, deadline))
+
+        self.isend(EPOCH.pack(self.epoch) + task, dest=rank, tag=TASK)
+        self.inflight[rank].append(self.epoch)
+        self.telemetry.dispatched(rank)
+
+    def outstanding(self):
+        return sum(epochs.count(self.epoch) for epochs in self.inflight.values())
+
+    def farm(self, tasks, handler, deadline=None):
+        # a queued task only starts once the one before it is done, so with a deadline every
+        # worker gets one task at a time and its budget is not eaten up waiting in line
+        depth = self.prefetch if deadline is None else 1
+        self.telemetry.started(self.workers)
+
+        try:
+            while True:
+                for rank in range(1, self.size):
+                    while len(self.inflight[rank]) < depth and len(tasks) > 0 and not expired(deadline):
+                        self.dispatch(tasks, rank, deadline)
+
+                self.sends = [(request, data) for request, data in self.sends if not request.Test()]
+
+                if self.outstanding() == 0 and (len(tasks) == 0 or expired(deadline)):
+                    break
+
+                if self.comm.Iprobe(source=self.MPI.ANY_SOURCE, tag=self.MPI.ANY_TAG):
+                    source, tag, data = self.recv(source=self.MPI.ANY_SOURCE)
+                elif self.compute and len(tasks) > 0 and not expired(deadline):
+                    # nothing to answer, so rank 0 runs a task itself
+                    task = self.take(tasks, 0, deadline)
+
+                    start_time = time.perf_counter()
+                    result = handler(task, self.local_root)
+                    self.telemetry.completed(0, time.perf_counter() - start_time)
+
+                    yield result
+                    continue
+                else:
+                    start_time = time.time()
+                    source, tag, data = self.recv(source=self.MPI.ANY_SOURCE)
+                    self.telemetry.waited(time.time() - start_time)
+
+                self.inflight[source].pop(0)
+
+                if tag == RESULT:
+                    # a task from an older epoch still kept the worker busy
+                    epoch, seconds = RESULT_HEADER.unpack_from(data)
+                    self.telemetry.completed(source, seconds, epoch != self.epoch)
+
+                    if epoch == self.epoch:
+                        yield self.codec.decode_result(data[RESULT_HEADER.size:])
+
+            self.telemetry.finished()
+        finally:
+            # the caller stopped reading early, the workers drop what they still have of this epoch
+            if self.outstanding() > 0:
+                self.cancel()
+
+    def close(self):
+        self.MPI.Request.Waitall(self.broadcasts)
+        self.MPI.Request.Waitall([request for request, _ in self.sends])
+
+        for i in range(1, self.size):
+            self.send(b"", dest=i, tag=END)
+
+
+# the root this pool process last read from shared memory, and the block the master keeps
+# its current epoch in
+local_root = {"epoch": None, "root": None, "current": None}
+
+
+def run_local(handler, codec, name, size, current, epoch, task):
+    # the process id stands in for a rank in the telemetry
+    if local_root["epoch"] is not None and local_root["epoch"] > epoch:
+        return os.getpid(), 0, None
+
+    if local_root["epoch"] != epoch:
+        # the master owns the block and unlinks it, this process only reads it
+        memory = SharedMemory(name=name)
+        local_root["root"] = codec.decode_root(bytes(memory.buf[:size]))
+        local_root["epoch"] = epoch
+        memory.close()
+
+    if local_root["current"] is None or local_root["current"].name != current:
+        local_root["current"] = SharedMemory(name=current)
+
+    task["stop"] = Superseded(lambda: EPOCH.unpack_from(local_root["current"].buf)[0] != epoch)
+
+    start_time = time.perf_counter()
+    result = handler(task, local_root["root"])
+
+    return os.getpid(), time.perf_counter() - start_time, result
+
+
+class LocalTransport:
+    rank = 0
+
+    def __init__(self, processes=None, codec=None, initializer=None, initargs=()):
+        if processes is None:
+            processes = os.cpu_count()
+
+        # every pool process runs initializer(*initargs) first; processes started with spawn import
+        # the modules afresh, so settings the master made to module globals have to go this way
+        self.executor = ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs)
+        self.size = processes + 1
+        self.codec = codec if codec is not None else PickleCodec()
+
+        # the root lives in shared memory, every process decodes it once per epoch; an old block is
+        # unlinked on the next broadcast unless a task left running from its epoch may still attach
+        # to it, running holds the block name of every task that went out and is not done yet
+        self.epoch = 0
+        self.memory = None
+        self.memories = []
+        self.running = {}
+        self.root_size = 0
+
+        # the epoch the master is on, a running task stops once it moves past the task's own
+        self.current = SharedMemory(create=True, size=EPOCH.size)
+        EPOCH.pack_into(self.current.buf, 0, self.epoch)
+
+        # pool processes get ranks from 1 in the order they first finish a task; the pool
+        # pickles tasks itself, so only messages are counted and not their bytes
+        self.telemetry = Telemetry(self.size)
+        self.ranks = {}
+
+    @property
+    def workers(self):
+        return self.size - 1
+
+    def serve(self, handler):
+        raise Exception("Local workers are started by the process pool")
+
+    def release(self, keep=None):
+        # unlinks every block but keep that no running task can attach to any more
+        self.running = {future: name for future, name in self.running.items() if not future.done()}
+        busy = set(self.running.values())
+
+        left = []
+        for memory in self.memories:
+            if memory is keep or memory.name in busy:
+                left.append(memory)
+            else:
+                memory.close()
+                memory.unlink()
+
+        self.memories = left
+        if keep is None:
+            self.memory = None
+
+    def broadcast(self, root):
+        data = self.codec.encode_root(root)
+
+        self.memory = SharedMemory(create=True, size=max(1, len(data)))
+        self.memory.buf[:len(data)] = data
+        self.memories.append(self.memory)
+
+        self.root_size = len(data)
+        self.next_epoch()
+        self.release(self.memory)
+
+    def cancel(self):
+        # the same block under a new epoch, the tasks of the old one stop once they see it
+        self.next_epoch()
+
+    def next_epoch(self):
+        self.epoch += 1
+        EPOCH.pack_into(self.current.buf, 0, self.epoch)
+
+    def farm(self, tasks, handler, deadline=None):
+        # keep a couple of tasks queued per process so nobody waits for the next one
+        pending = set()
+        self.telemetry.started(self.workers)
+
+        try:
+            while len(pending) > 0 or (len(tasks) > 0 and not expired(deadline)):
+                while len(tasks) > 0 and len(pending) < 2 * self.workers and not expired(deadline):
+                    # the pool decides which process runs a task, so affinity is of no use here
+                    task = tasks.pop()
+                    task.pop("affinity", None)
+
+                    future = self.executor.submit(run_local, handler, self.codec, self.memory.name,
+                                                  self.root_size, self.current.name, self.epoch,
+                                                  stamp(task, deadline))
+                    pending.add(future)
+                    self.running[future] = self.memory.name
+
+                    if len(tasks) == 0:
+                        self.telemetry.drained()
+
+                timeout = None
+                if deadline is not None and len(tasks) > 0:
+                    timeout = max(0, deadline - time.time())
+
+                start_time = time.time()
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                self.telemetry.waited(time.time() - start_time)
+
+                if expired(deadline):
+                    # whatever has not started yet is dropped, running tasks stop on their own
+                    for future in pending:
+                        future.cancel()
+
+                for future in done:
+                    if future.cancelled():
+                        continue
+
+                    pid, seconds, result = future.result()
+                    rank = self.ranks.setdefault(pid, len(self.ranks) + 1)
+
+                    self.telemetry.sent(rank, 0)
+                    self.telemetry.received(rank, 0)
+                    self.telemetry.completed(rank, seconds)
+
+                    if result is not None:
+                        yield result
+
+            self.telemetry.finished()
+        finally:
+            # the caller may stop reading early, the tasks that have not started are dropped and
+            # the ones already running are told to stop
+            running = [future for future in pending if not future.cancel()]
+            if len(running) > 0:
+                self.cancel()
+
+    def close(self):
+        self.executor.shutdown()
+        self.release()
+
+        self.current.close()
+        self.current.unlink()